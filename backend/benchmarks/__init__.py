@@ -0,0 +1,8 @@
+"""Suite de rendimiento de la API: generador de datos sinteticos, escenarios y runner.
+
+Uso (desde backend/):
+    python -m benchmarks seed --scale 10k --database-url sqlite:///bench.db
+    python -m benchmarks run --database-url sqlite:///bench.db --output resultados.json
+    python -m benchmarks run --base-url http://127.0.0.1:8000 --server-pid 1234
+    python -m benchmarks plans   # indices usados por cada endpoint (EXPLAIN QUERY PLAN)
+"""
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _configure_database(url: str | None):
+    # db.py lee DATABASE_URL al importarse: hay que fijarla antes de importar main
+    if url:
+        os.environ["DATABASE_URL"] = url
+
+
+def seed(args):
+    _configure_database(args.database_url)
+    from sqlmodel import Session
+
+    from benchmarks.datagen import SCALES, generate
+    from main import STORAGE_ROOT, engine, init_db
+
+    STORAGE_ROOT.mkdir(parents=True, exist_ok=True)
+    init_db()
+    started = time.perf_counter()
+    with Session(engine) as session:
+        counts = generate(session, SCALES.get(args.scale) or int(args.scale), seed=args.seed)
+    elapsed = time.perf_counter() - started
+    summary = ", ".join(f"{table}={count}" for table, count in counts.items())
+    print(f"Datos generados en {elapsed:.1f}s: {summary}")
+
+
+def run(args):
+    _configure_database(args.database_url)
+    if args.no_cache:
+        os.environ["RESPONSE_CACHE_TTL"] = "0"
+    from benchmarks.runner import run as run_scenarios
+    from benchmarks.scenarios import select_scenarios
+
+    report = asyncio.run(
+        run_scenarios(
+            select_scenarios(args.scenario),
+            base_url=args.base_url,
+            server_pid=args.server_pid,
+            concurrency=args.concurrency,
+            warmup=args.warmup,
+            seed=args.seed,
+            requests=args.requests,
+        )
+    )
+    report["meta"]["response_cache"] = not args.no_cache if not args.base_url else None
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+def plans(args):
+    # Sin cache: una respuesta cacheada no lanzaria las consultas que hay que comprobar
+    os.environ["RESPONSE_CACHE_TTL"] = "0"
+    if args.database_url:
+        _configure_database(args.database_url)
+        temporary = None
+    else:
+        # Sin base de datos se genera una pequena: sin ANALYZE el planificador de
+        # SQLite no depende del volumen y los planes son los mismos que con 100k
+        temporary = tempfile.TemporaryDirectory()
+        _configure_database(f"sqlite:///{Path(temporary.name) / 'plans.db'}")
+        seed(argparse.Namespace(database_url=None, scale=str(args.vehicles), seed=42))
+    from benchmarks.plans import check_plans
+
+    try:
+        results = check_plans()
+    finally:
+        if temporary is not None:
+            from main import engine
+
+            engine.dispose()
+            temporary.cleanup()
+    for result in results:
+        print(f"{'OK   ' if result['ok'] else 'FALLO'} {result['path']} ({result['statements']} consultas)")
+        if not result["ok"] or args.verbose:
+            if result["status"] != 200:
+                print(f"        estado HTTP {result['status']}")
+            for index in result["missing"]:
+                print(f"        no usa {index}")
+            for line in result["plan"]:
+                print(f"        {line}")
+    failed = sum(not result["ok"] for result in results)
+    if failed:
+        print(f"{failed} de {len(results)} endpoints sin el plan esperado")
+        return 1
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)["scenarios"]
+    with open(args.candidate) as handle:
+        candidate = json.load(handle)["scenarios"]
+    print(f"{'escenario':<20} {'p95 base':>10} {'p95 nuevo':>10} {'cambio':>8}")
+    for name, result in candidate.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["p95_ms"], result["p95_ms"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:<20} {before:>10.2f} {after:>10.2f} {change:>+7.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks de la API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="rellenar una base de datos con datos sinteticos")
+    seed_parser.add_argument("--scale", default="1k", help="1k, 10k, 100k o un numero de vehiculos")
+    seed_parser.add_argument("--database-url", help="por defecto la variable DATABASE_URL")
+    seed_parser.add_argument("--seed", type=int, default=42)
+    seed_parser.set_defaults(handler=seed)
+
+    run_parser = commands.add_parser("run", help="ejecutar los escenarios y emitir un informe JSON")
+    run_parser.add_argument("--database-url", help="base de datos para el modo en proceso")
+    run_parser.add_argument("--base-url", help="URL de un uvicorn en marcha; sin ella la app corre en proceso")
+    run_parser.add_argument("--server-pid", type=int, help="pid del servidor para medir su RSS maximo por escenario (psutil, o /proc en Linux)")
+    run_parser.add_argument("--scenario", action="append", default=[], help="repetible; por defecto todos")
+    run_parser.add_argument("--requests", type=int, help="peticiones por escenario (sustituye al valor de cada escenario)")
+    run_parser.add_argument("--concurrency", type=int, default=1)
+    run_parser.add_argument("--warmup", type=int, default=5)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--no-cache", action="store_true", help="desactivar la cache de respuestas (modo en proceso)")
+    run_parser.add_argument("--output", help="fichero JSON de salida; por defecto stdout")
+    run_parser.set_defaults(handler=run)
+
+    plans_parser = commands.add_parser("plans", help="comprobar que las consultas de cada endpoint usan sus indices")
+    plans_parser.add_argument("--database-url", help="SQLite con datos; por defecto una base temporal generada")
+    plans_parser.add_argument("--vehicles", type=int, default=200, help="vehiculos de la base temporal")
+    plans_parser.add_argument("--verbose", action="store_true", help="mostrar el plan de todos los endpoints")
+    plans_parser.set_defaults(handler=plans)
+
+    compare_parser = commands.add_parser("compare", help="comparar el p95 de dos informes")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
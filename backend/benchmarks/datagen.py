@@ -0,0 +1,165 @@
+"""Generador determinista de datos sinteticos para las tablas de la API."""
+from __future__ import annotations
+
+import random
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List
+
+from sqlalchemy import func, insert
+from sqlmodel import Session, select
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+BATCH_SIZE = 2_000
+BASE_DATE = date(2022, 1, 1)
+DAYS_SPAN = 3 * 365
+
+BRANDS = {
+    "Seat": ["Ibiza", "Leon", "Arona", "Ateca"],
+    "Volkswagen": ["Golf", "Polo", "Tiguan", "Passat"],
+    "Renault": ["Clio", "Megane", "Captur", "Kadjar"],
+    "Peugeot": ["208", "308", "2008", "3008"],
+    "Toyota": ["Yaris", "Corolla", "C-HR", "RAV4"],
+    "Ford": ["Fiesta", "Focus", "Kuga", "Puma"],
+}
+COLORS = ["blanco", "negro", "gris", "rojo", "azul", "plata"]
+CONCEPTS = ["taller", "neumaticos", "limpieza", "ITV", "chapa y pintura", "transporte"]
+DOC_TYPES = ["ficha tecnica", "permiso circulacion", "factura compra", "contrato venta"]
+PLATE_LETTERS = "BCDFGHJKLMNPRSTVWXYZ"
+
+
+def _plate(index: int) -> str:
+    letters = ""
+    rest = index // 10_000
+    for _ in range(3):
+        letters += PLATE_LETTERS[rest % len(PLATE_LETTERS)]
+        rest //= len(PLATE_LETTERS)
+    return f"{index % 10_000:04d}{letters}"
+
+
+def _vin(rng: random.Random) -> str:
+    return "".join(rng.choice("ABCDEFGHJKLMNPRSTUVWXYZ0123456789") for _ in range(17))
+
+
+def _batches(rows: Iterator[Dict], size: int = BATCH_SIZE) -> Iterator[List[Dict]]:
+    batch: List[Dict] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(session: Session, vehicles: int, seed: int = 42) -> Dict[str, int]:
+    """Inserta `vehicles` vehiculos con sus gastos, ventas, fotos, documentos y traspasos.
+
+    Con la misma semilla y escala los datos son identicos, para poder comparar commits.
+    """
+    from main import Branch, Document, Expense, Photo, Sale, Transfer, Vehicle, VehicleState, rebuild_dashboard_rollup
+
+    rng = random.Random(seed)
+    branch_ids = session.exec(select(Branch.id)).all()
+    first_id = (session.exec(select(func.max(Vehicle.id))).one() or 0) + 1
+    counts = {"vehicle": 0, "expense": 0, "sale": 0, "photo": 0, "document": 0, "transfer": 0}
+    children: Dict[str, List[Dict]] = {name: [] for name in ("expense", "sale", "photo", "document", "transfer")}
+    tables = {"expense": Expense, "sale": Sale, "photo": Photo, "document": Document, "transfer": Transfer}
+
+    def flush_children(force: bool = False):
+        for name, rows in children.items():
+            if rows and (force or len(rows) >= BATCH_SIZE):
+                session.execute(insert(tables[name].__table__), rows)
+                counts[name] += len(rows)
+                rows.clear()
+
+    def vehicle_rows() -> Iterator[Dict]:
+        for offset in range(vehicles):
+            vehicle_id = first_id + offset
+            brand = rng.choice(list(BRANDS))
+            purchase_date = BASE_DATE + timedelta(days=rng.randrange(DAYS_SPAN))
+            purchase_price = float(rng.randrange(3_000, 40_000, 50))
+            branch_id = rng.choice(branch_ids)
+            # created_at crece con el id, como en altas reales: el listado por cursor depende de ello
+            created_at = datetime.combine(BASE_DATE, datetime.min.time()) + timedelta(minutes=vehicle_id)
+            sold = rng.random() < 0.45
+            sale_date = purchase_date + timedelta(days=rng.randrange(7, 180)) if sold else None
+            sale_price = round(purchase_price * rng.uniform(1.05, 1.35), 2) if sold else None
+
+            for _ in range(rng.randrange(0, 6)):
+                children["expense"].append(
+                    {
+                        "vehicle_id": vehicle_id,
+                        "concept": rng.choice(CONCEPTS),
+                        "amount": round(rng.uniform(30, 1_500), 2),
+                        "expense_date": purchase_date + timedelta(days=rng.randrange(0, 60)),
+                        "created_at": created_at,
+                    }
+                )
+            if sold:
+                children["sale"].append(
+                    {
+                        "vehicle_id": vehicle_id,
+                        "sale_price": sale_price,
+                        "sale_date": sale_date,
+                        "client_name": f"Cliente {vehicle_id}",
+                        "created_at": created_at,
+                    }
+                )
+            for order in range(rng.randrange(0, 8)):
+                children["photo"].append(
+                    {
+                        "vehicle_id": vehicle_id,
+                        "file_name": f"foto_{order}.jpg",
+                        "stored_path": f"bench/{vehicle_id}/foto_{order}.jpg",
+                        "display_order": order,
+                        "uploaded_at": created_at,
+                    }
+                )
+            for doc_type in rng.sample(DOC_TYPES, rng.randrange(0, 3)):
+                children["document"].append(
+                    {
+                        "vehicle_id": vehicle_id,
+                        "doc_type": doc_type,
+                        "file_name": f"{doc_type}.pdf",
+                        "stored_path": f"bench/{vehicle_id}/{doc_type}.pdf",
+                        "uploaded_at": created_at,
+                    }
+                )
+            if len(branch_ids) > 1 and rng.random() < 0.1:
+                children["transfer"].append(
+                    {
+                        "vehicle_id": vehicle_id,
+                        "from_branch_id": rng.choice([b for b in branch_ids if b != branch_id]),
+                        "to_branch_id": branch_id,
+                        "transfer_date": purchase_date + timedelta(days=rng.randrange(1, 30)),
+                        "created_at": created_at,
+                    }
+                )
+
+            yield {
+                "id": vehicle_id,
+                "vin": _vin(rng),
+                "license_plate": _plate(vehicle_id),
+                "brand": brand,
+                "model": rng.choice(BRANDS[brand]),
+                "year": rng.randrange(2008, 2024),
+                "km": rng.randrange(5_000, 250_000),
+                "color": rng.choice(COLORS),
+                "branch_id": branch_id,
+                "status": VehicleState.SOLD if sold else rng.choice([VehicleState.PENDING, VehicleState.REVIEW, VehicleState.SHOWROOM, VehicleState.RESERVED]),
+                "purchase_price": purchase_price,
+                "sale_price": sale_price,
+                "purchase_date": purchase_date,
+                "sale_date": sale_date,
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+
+    for batch in _batches(vehicle_rows()):
+        session.execute(insert(Vehicle.__table__), batch)
+        counts["vehicle"] += len(batch)
+        flush_children()
+    flush_children(force=True)
+    session.commit()
+    rebuild_dashboard_rollup(session)
+    return counts
@@ -0,0 +1,129 @@
+"""Comprueba con EXPLAIN QUERY PLAN que las consultas de cada endpoint usan sus indices.
+
+Llama a los endpoints en proceso, captura las SELECT que lanzan y pide a SQLite su
+plan. Un endpoint falla si falta alguno de los indices esperados o si recorre una
+tabla entera (`SCAN tabla` sin indice) que no este en `allow_scans`. Un
+`SCAN ... USING INDEX` es un recorrido ordenado del indice, como el del listado
+paginado, y se admite.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+
+
+@dataclass
+class PlanCheck:
+    path: str
+    indexes: Tuple[str, ...]
+    # Tablas que se pueden recorrer enteras: el rollup (sedes x meses) o una exportacion completa
+    allow_scans: Tuple[str, ...] = ()
+
+
+PLAN_CHECKS: List[PlanCheck] = [
+    PlanCheck("/vehicles?limit=100", ("ix_vehicle_created_id",)),
+    PlanCheck("/vehicles?state=vendido&branch_id=1&limit=100", ("ix_vehicle_status_branch_created",)),
+    PlanCheck("/vehicles?branch_id=1&from_date=2023-01-01&to_date=2023-12-31&limit=100", ("ix_vehicle_branch_purchase_date",)),
+    PlanCheck("/vehicles/{vehicle_id}/expenses", ("ix_expense_vehicle_date",)),
+    PlanCheck("/vehicles/{vehicle_id}/documents", ("ix_document_vehicle_uploaded",)),
+    PlanCheck("/vehicles/{vehicle_id}/photos", ("ix_photo_vehicle_order",)),
+    PlanCheck(
+        "/vehicles/{vehicle_id}/full",
+        ("ix_expense_vehicle_date", "ix_document_vehicle_uploaded", "ix_photo_vehicle_order", "ix_transfer_vehicle_date"),
+    ),
+    PlanCheck("/dashboard/series?from_date=2023-01-01&to_date=2023-12-31", ("ix_sale_date_price", "ix_expense_date_vehicle")),
+    # Con sede el planificador parte de los vehiculos de la sede y baja a gastos por vehiculo
+    PlanCheck(
+        "/dashboard/series?branch_id=1&from_date=2023-01-01&to_date=2023-12-31",
+        ("ix_vehicle_branch_purchase_date", "ix_expense_vehicle_date"),
+    ),
+    # Meses completos del rollup y los dias sueltos de los extremos desde ventas y gastos
+    PlanCheck(
+        "/dashboard?from_date=2023-01-15&to_date=2023-06-20",
+        ("ix_sale_date_price", "ix_expense_date_vehicle"),
+        allow_scans=("dashboardrollup",),
+    ),
+    PlanCheck(
+        "/dashboard?branch_id=1&from_date=2023-01-15&to_date=2023-06-20",
+        ("ix_vehicle_branch_purchase_date", "ix_expense_vehicle_date"),
+    ),
+    PlanCheck("/reports/vehicle-margins", ("ix_expense_vehicle_date",)),
+    PlanCheck(
+        "/reports/vehicle-margins?branch_id=1&sort=days_in_stock",
+        ("ix_expense_vehicle_date", "ix_vehicle_branch_purchase_date"),
+    ),
+    PlanCheck("/export/vehicles", (), allow_scans=("vehicle",)),
+    PlanCheck("/export/vehicles?state=vendido&branch_id=1", ("ix_vehicle_status_branch_created",)),
+    PlanCheck("/export/vehicles?branch_id=1&from_date=2023-01-01&to_date=2023-12-31", ("ix_vehicle_branch_purchase_date",)),
+    PlanCheck("/export/expenses", ("ix_expense_date_vehicle",)),
+    PlanCheck("/export/expenses?from_date=2023-01-01&to_date=2023-12-31", ("ix_expense_date_vehicle",)),
+    PlanCheck("/export/expenses?vehicle_id={vehicle_id}", ("ix_expense_vehicle_date",)),
+    PlanCheck("/export/sales", ("ix_sale_date_price",)),
+    PlanCheck("/export/sales?from_date=2023-01-01&to_date=2023-12-31", ("ix_sale_date_price",)),
+    PlanCheck("/export/sales?branch_id=1&from_date=2023-01-01&to_date=2023-12-31", ("ix_vehicle_branch_purchase_date",)),
+]
+
+
+def _full_scans(plan: List[str], allowed: Tuple[str, ...] = ()) -> List[str]:
+    # "SCAN vehicle" o "SCAN vehicle USING INTEGER PRIMARY KEY"; no "SCAN ... USING [COVERING] INDEX"
+    return [
+        line for line in plan
+        if line.startswith("SCAN ") and "INDEX" not in line and line.split()[1] not in allowed
+    ]
+
+
+def check_plans(checks: List[PlanCheck] = PLAN_CHECKS) -> List[Dict]:
+    """Ejecuta las comprobaciones y devuelve un resultado por endpoint."""
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session, select
+
+    from main import Vehicle, app, engine, sql_engines
+
+    if engine.dialect.name != "sqlite":
+        raise SystemExit("La comprobacion de planes solo esta disponible con SQLite")
+
+    captured: List[Tuple[str, tuple]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            captured.append((statement, parameters))
+
+    for target in sql_engines:
+        event.listen(target, "before_cursor_execute", capture)
+    results = []
+    try:
+        with TestClient(app) as client:
+            with Session(engine) as session:
+                vehicle_id = session.exec(select(Vehicle.id).order_by(Vehicle.id)).first()
+            if vehicle_id is None:
+                raise SystemExit("La base de datos no tiene vehiculos: ejecuta antes `python -m benchmarks seed`")
+            for check in checks:
+                path = check.path.format(vehicle_id=vehicle_id)
+                captured.clear()
+                response = client.get(path)
+                statements = list(captured)
+                plan: List[str] = []
+                with engine.connect() as connection:
+                    for statement, parameters in statements:
+                        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+                        plan.extend(row[-1] for row in rows)
+                used = " ".join(plan)
+                missing = [index for index in check.indexes if f"INDEX {index}" not in used]
+                scans = _full_scans(plan, check.allow_scans)
+                results.append(
+                    {
+                        "path": path,
+                        "status": response.status_code,
+                        "statements": len(statements),
+                        "missing": missing,
+                        "scans": scans,
+                        "plan": plan,
+                        "ok": response.status_code == 200 and bool(statements) and not missing and not scans,
+                    }
+                )
+    finally:
+        for target in sql_engines:
+            event.remove(target, "before_cursor_execute", capture)
+    return results
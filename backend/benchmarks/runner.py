@@ -0,0 +1,197 @@
+"""Ejecuta escenarios contra la app en proceso (ASGI) o contra un uvicorn en marcha."""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.scenarios import Scenario
+
+try:
+    import psutil
+except ImportError:  # sin psutil el RSS solo se puede leer de /proc (Linux)
+    psutil = None
+
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por rango mas cercano sobre una lista ya ordenada."""
+    if not values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def rss_kb(pid: int) -> Optional[int]:
+    """RSS actual del proceso en KB, o None si no se puede leer en esta plataforma."""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss // 1024
+        except psutil.Error:
+            return None
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler:
+    """Muestrea el RSS de un proceso en un hilo mientras dura un escenario y guarda el maximo.
+
+    El pico es el de ese escenario, no el acumulado del proceso como ru_maxrss o VmHWM.
+    Va en un hilo porque en modo en proceso el bucle de eventos esta ocupado con la app.
+    """
+
+    def __init__(self, pid: Optional[int], interval: float = RSS_SAMPLE_INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _sample(self):
+        current = rss_kb(self.pid)
+        if current is not None and (self.peak_kb is None or current > self.peak_kb):
+            self.peak_kb = current
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if self.pid:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.pid:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    max_id: int,
+    concurrency: int,
+    warmup: int,
+    seed: int,
+) -> Dict:
+    rng = random.Random(f"{seed}:{scenario.name}")
+    paths = [scenario.path(rng, max_id) for _ in range(scenario.requests)]
+    for path in paths[:warmup]:
+        await client.get(path)
+
+    latencies: List[float] = []
+    errors = 0
+    queue = iter(paths)
+
+    async def worker():
+        nonlocal errors
+        for path in queue:
+            started = time.perf_counter()
+            response = await client.get(path)
+            await response.aread()
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+async def run(
+    scenarios: List[Scenario],
+    base_url: Optional[str] = None,
+    server_pid: Optional[int] = None,
+    concurrency: int = 1,
+    warmup: int = 5,
+    seed: int = 42,
+    requests: Optional[int] = None,
+) -> Dict:
+    """Lanza los escenarios en orden y devuelve el informe completo como dict."""
+    if base_url:
+        client = httpx.AsyncClient(base_url=base_url, timeout=60)
+        lifespan = contextlib.nullcontext()
+        mode = "live"
+    else:
+        from main import app
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+        lifespan = app.router.lifespan_context(app)
+        mode = "inprocess"
+
+    results: Dict[str, Dict] = {}
+    async with lifespan, client:
+        max_id = await _max_vehicle_id(client)
+        for scenario in scenarios:
+            if requests:
+                scenario = Scenario(scenario.name, scenario.path, requests)
+            with RssSampler(server_pid if mode == "live" else os.getpid()) as sampler:
+                result = await _run_scenario(client, scenario, max_id, concurrency, warmup, seed)
+            result["peak_rss_kb"] = sampler.peak_kb
+            results[scenario.name] = result
+            print(
+                f"{scenario.name:<20} p50={result['p50_ms']:>8.2f}ms p95={result['p95_ms']:>8.2f}ms "
+                f"p99={result['p99_ms']:>8.2f}ms {result['throughput_rps']:>8.1f} req/s errores={result['errors']}",
+                file=sys.stderr,
+            )
+
+    return {
+        "meta": {
+            "mode": mode,
+            "base_url": base_url,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "max_vehicle_id": max_id,
+            "seed": seed,
+            "rss_source": "psutil" if psutil is not None else "/proc",
+        },
+        "scenarios": results,
+    }
+
+
+async def _max_vehicle_id(client: httpx.AsyncClient) -> int:
+    # El listado va por created_at descendente y el generador lo hace crecer con el id
+    response = await client.get("/vehicles", params={"limit": 1})
+    items = response.json() if response.status_code == 200 else []
+    return items[0]["id"] if items else 1
@@ -0,0 +1,45 @@
+"""Escenarios de carga: cada uno construye la ruta de una peticion GET."""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Callable, List
+
+SEARCH_TERMS = ["golf", "ibiza", "toyota", "rojo", "0042", "clio", "peugeot 308"]
+
+
+@dataclass
+class Scenario:
+    name: str
+    path: Callable[[random.Random, int], str]
+    requests: int = 200
+
+
+def _vehicle_id(rng: random.Random, max_id: int) -> int:
+    return rng.randint(1, max(max_id, 1))
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("vehicles_page", lambda rng, max_id: "/vehicles?limit=100"),
+    Scenario("vehicles_all", lambda rng, max_id: "/vehicles", requests=20),
+    Scenario("vehicles_filtered", lambda rng, max_id: f"/vehicles?state=vendido&branch_id={rng.randint(1, 2)}&limit=100"),
+    Scenario("vehicle_detail", lambda rng, max_id: f"/vehicles/{_vehicle_id(rng, max_id)}"),
+    Scenario("vehicle_full", lambda rng, max_id: f"/vehicles/{_vehicle_id(rng, max_id)}/full"),
+    Scenario("vehicle_expenses", lambda rng, max_id: f"/vehicles/{_vehicle_id(rng, max_id)}/expenses"),
+    Scenario("vehicle_search", lambda rng, max_id: f"/vehicles/search?q={rng.choice(SEARCH_TERMS)}"),
+    Scenario("dashboard", lambda rng, max_id: "/dashboard"),
+    Scenario("dashboard_range", lambda rng, max_id: f"/dashboard?from_date=2023-0{rng.randint(1, 9)}-01&to_date=2023-12-31"),
+    Scenario("dashboard_series", lambda rng, max_id: "/dashboard/series?bucket=month&group_by=branch"),
+    Scenario("vehicle_margins", lambda rng, max_id: "/reports/vehicle-margins?limit=100"),
+    Scenario("export_vehicles", lambda rng, max_id: "/export/vehicles", requests=10),
+]
+
+
+def select_scenarios(names: List[str]) -> List[Scenario]:
+    if not names:
+        return list(SCENARIOS)
+    known = {scenario.name: scenario for scenario in SCENARIOS}
+    missing = [name for name in names if name not in known]
+    if missing:
+        raise ValueError(f"Escenarios desconocidos: {', '.join(missing)}")
+    return [known[name] for name in names]
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """Almacen de ficheros direccionado por contenido.
+
+    Cada fichero se guarda una sola vez en ``<root>/sha256/ab/cd/<hash>``; subir el
+    mismo contenido otra vez no vuelve a escribir nada en disco.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.tmp_dir = root / "tmp"
+
+    def path_for(self, sha256: str) -> Path:
+        return self.root / "sha256" / sha256[:2] / sha256[2:4] / sha256
+
+    def put(self, source: BinaryIO) -> Tuple[str, int, Path, bool]:
+        """Guarda `source` calculando el hash mientras se copia a un temporal.
+
+        Devuelve (sha256, tamano, ruta, creado); `creado` es False si el blob ya existia.
+        """
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    tmp.write(chunk)
+            sha256 = digest.hexdigest()
+            destination = self.path_for(sha256)
+            if destination.exists():
+                os.unlink(tmp_name)
+                # Se renueva la fecha para que gc_blobs respete el periodo de gracia mientras
+                # esta subida confirma su fila en Blob
+                os.utime(destination)
+                return sha256, size, destination, False
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            # os.replace es atomico: dos subidas simultaneas del mismo contenido dejan un unico fichero valido
+            os.replace(tmp_name, destination)
+            return sha256, size, destination, True
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    def iter_blobs(self) -> Iterator[Tuple[str, Path]]:
+        """(sha256, ruta) de cada blob en disco, sin las variantes de las fotos."""
+        for path in (self.root / "sha256").glob("*/*/*"):
+            if len(path.name) == 64 and path.is_file():
+                yield path.name, path
+
+    def discard(self, sha256: str) -> None:
+        """Borra el fichero de un blob y sus variantes (`<hash>.thumb.jpg`, ...)."""
+        path = self.path_for(sha256)
+        for derivative in path.parent.glob(f"{sha256}.*"):
+            derivative.unlink(missing_ok=True)
+        path.unlink(missing_ok=True)
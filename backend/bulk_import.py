@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import json
+import tempfile
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+FORMATS = ("csv", "ndjson")
+
+
+def detect_format(request: Request, requested: Optional[str] = None) -> str:
+    if requested:
+        return requested
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type or "json-seq" in content_type:
+        return "ndjson"
+    raise HTTPException(
+        status_code=415,
+        detail="Formato no reconocido: usa Content-Type text/csv o application/x-ndjson, o el parametro format",
+    )
+
+
+async def spool_body(request: Request) -> BinaryIO:
+    """Copia el cuerpo de la peticion a un temporal sin cargarlo entero en memoria."""
+    spool = tempfile.TemporaryFile()
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def check_utf8(source: BinaryIO, chunk_size: int = 1024 * 1024) -> None:
+    """Comprueba que todo el cuerpo es UTF-8 antes de importar nada.
+
+    Se hace sobre el temporal y antes del primer lote: un error de codificacion a mitad
+    de fichero dejaria confirmados los lotes anteriores sin que el cliente lo sepa.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    offset = 0
+    line = 1
+    try:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                decoder.decode(b"", final=True)
+                break
+            try:
+                decoder.decode(chunk)
+            except UnicodeDecodeError as e:
+                line += chunk.count(b"\n", 0, e.start)
+                raise HTTPException(
+                    status_code=400,
+                    detail=(
+                        f"El fichero no esta en UTF-8 (linea {line}, byte {offset + e.start}): "
+                        "guardalo como CSV UTF-8 (en Excel, 'CSV UTF-8 delimitado por comas')"
+                    ),
+                )
+            line += chunk.count(b"\n")
+            offset += len(chunk)
+    except UnicodeDecodeError:
+        # Secuencia multibyte cortada al final del fichero
+        raise HTTPException(status_code=400, detail="El fichero no esta en UTF-8: termina con un caracter incompleto")
+    finally:
+        source.seek(0)
+
+
+def iter_records(source: BinaryIO, fmt: str) -> Iterator[Tuple[int, object]]:
+    """Devuelve (numero de linea, registro) leyendo `source` de forma incremental.
+
+    En CSV la primera fila es la cabecera y los valores vacios se convierten en None.
+    Una linea NDJSON que no es JSON valido se devuelve como excepcion para que el
+    llamante la registre como error de esa fila.
+    """
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, {key: (value if value != "" else None) for key, value in record.items() if key}
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+# Segundos que el token se queda por detras del reloj. Una transaccion que fija
+# updated_at y confirma un poco despues no se pierde: esas filas se reenvian en la
+# siguiente consulta y el cliente las fusiona por id.
+CHANGE_FEED_LAG = float(os.getenv("CHANGE_FEED_LAG", "2"))
+# Cada cuanto el stream SSE mira la base de datos, para ver cambios hechos por otros workers
+CHANGE_STREAM_POLL = float(os.getenv("CHANGE_STREAM_POLL", "5"))
+
+ChangeToken = Tuple[datetime, int, int]
+EPOCH_TOKEN: ChangeToken = (datetime.min, 0, 0)
+
+
+def encode_change_token(updated_at: datetime, vehicle_id: int, tombstone_id: int) -> str:
+    """Token opaco con la posicion (updated_at, id) en vehiculos y el ultimo id de borrados."""
+    raw = json.dumps([updated_at.isoformat(), vehicle_id, tombstone_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_change_token(token: str) -> ChangeToken:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        updated_at, vehicle_id, tombstone_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(updated_at), int(vehicle_id), int(tombstone_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Token de cambios no valido")
+
+
+class ChangeNotifier:
+    """Avisa a los streams SSE de este proceso cuando un endpoint escribe vehiculos.
+
+    `notify` se llama desde el threadpool de los endpoints sincronos, asi que cada
+    suscriptor guarda su bucle de eventos y se le despierta con call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._subscribers: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Tuple[asyncio.AbstractEventLoop, asyncio.Event]:
+        subscriber = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Tuple[asyncio.AbstractEventLoop, asyncio.Event]):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def notify(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, event in subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Bucle ya cerrado: el stream se esta desmontando
+                pass
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+
+def sse_message(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+TOMBSTONE_TABLE = "vehicletombstone"
+# Los borrados se registran con un trigger para cubrir tambien los hechos a mano en la base de datos
+TOMBSTONE_TRIGGERS = {
+    "sqlite": (
+        f"""CREATE TRIGGER IF NOT EXISTS vehicle_tombstone_delete AFTER DELETE ON vehicle BEGIN
+            INSERT INTO {TOMBSTONE_TABLE}(vehicle_id, deleted_at) VALUES (old.id, CURRENT_TIMESTAMP);
+        END""",
+    ),
+    "postgresql": (
+        f"""CREATE OR REPLACE FUNCTION vehicle_tombstone() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO {TOMBSTONE_TABLE}(vehicle_id, deleted_at) VALUES (OLD.id, now() AT TIME ZONE 'utc');
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql""",
+        "DROP TRIGGER IF EXISTS vehicle_tombstone_delete ON vehicle",
+        "CREATE TRIGGER vehicle_tombstone_delete AFTER DELETE ON vehicle FOR EACH ROW EXECUTE FUNCTION vehicle_tombstone()",
+    ),
+}
+
+
+def install_tombstone_trigger(connection) -> bool:
+    statements = TOMBSTONE_TRIGGERS.get(connection.dialect.name)
+    if not statements:
+        print(f"Sin trigger de borrados para {connection.dialect.name}: /vehicles/changes no vera borrados")
+        return False
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    return True
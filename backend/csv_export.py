@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import csv
+import io
+import os
+import zlib
+from typing import Callable, Iterator, Sequence
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.sql import Select
+from sqlmodel import Session
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+def _csv_chunks(session_factory: Callable[[], Session], query: Select, headers: Sequence[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(headers)
+    # La sesion se abre aqui y no en la dependencia: FastAPI la cerraria antes de
+    # empezar a enviar el cuerpo de la respuesta.
+    with session_factory() as session:
+        result = session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for batch in result.partitions():
+            writer.writerows(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _gzip_chunks(chunks: Iterator[str]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # cabecera gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_csv(
+    session_factory: Callable[[], Session],
+    query: Select,
+    headers: Sequence[str],
+    filename: str,
+    gzip: bool = False,
+) -> StreamingResponse:
+    """Respuesta CSV que lee la consulta por lotes y la escribe a medida que se envia."""
+    chunks = _csv_chunks(session_factory, query, headers)
+    if gzip:
+        return StreamingResponse(
+            _gzip_chunks(chunks),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.csv.gz"'},
+        )
+    return StreamingResponse(
+        (chunk.encode("utf-8") for chunk in chunks),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'},
+    )
@@ -1,11 +1,194 @@
 from __future__ import annotations
 
 import os
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, Result, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///sahocars.db")
+DB_PROFILE = os.getenv("DB_PROFILE", "balanced")
+
+# Perfiles de rendimiento. "legacy" deja SQLite y el pool como venian por defecto.
+# Cualquier valor se puede sobrescribir con la variable de entorno del mismo nombre
+# en mayusculas y prefijo SQLITE_ o DB_ (p.ej. SQLITE_MMAP_SIZE, DB_POOL_SIZE).
+PROFILES = {
+    "legacy": {
+        "sqlite": {},
+        "pool": {},
+    },
+    "balanced": {
+        "sqlite": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 268435456,  # 256 MiB
+            "cache_size": -65536,  # 64 MiB (valor negativo = KiB)
+            "busy_timeout": 5000,
+            "temp_store": "MEMORY",
+        },
+        "pool": {
+            "pool_size": 10,
+            "max_overflow": 20,
+            "pool_pre_ping": True,
+            "pool_recycle": 1800,
+            "pool_timeout": 30,
+        },
+    },
+    "throughput": {
+        "sqlite": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 1073741824,  # 1 GiB
+            "cache_size": -262144,  # 256 MiB
+            "busy_timeout": 10000,
+            "temp_store": "MEMORY",
+        },
+        "pool": {
+            "pool_size": 20,
+            "max_overflow": 40,
+            "pool_pre_ping": True,
+            "pool_recycle": 1800,
+            "pool_timeout": 30,
+        },
+    },
+}
+
+SQLITE_PRAGMAS = ("journal_mode", "synchronous", "mmap_size", "cache_size", "busy_timeout", "temp_store")
+POOL_SETTINGS = {
+    "pool_size": int,
+    "max_overflow": int,
+    "pool_pre_ping": lambda value: value.lower() in ("1", "true", "yes", "si"),
+    "pool_recycle": int,
+    "pool_timeout": int,
+}
+
+
+def _profile_settings(profile: str) -> tuple:
+    if profile not in PROFILES:
+        raise ValueError(f"Perfil de base de datos desconocido: {profile} (opciones: {', '.join(PROFILES)})")
+    pragmas = dict(PROFILES[profile]["sqlite"])
+    for name in SQLITE_PRAGMAS:
+        value = os.getenv(f"SQLITE_{name.upper()}")
+        if value:
+            pragmas[name] = value
+    pool = dict(PROFILES[profile]["pool"])
+    for name, parse in POOL_SETTINGS.items():
+        value = os.getenv(f"DB_{name.upper()}")
+        if value:
+            pool[name] = parse(value)
+    return pragmas, pool
+
+
+def _install_sqlite_pragmas(engine: Engine, pragmas: dict) -> None:
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name in SQLITE_PRAGMAS:
+            if name in pragmas:
+                cursor.execute(f"PRAGMA {name}={pragmas[name]}")
+        cursor.close()
+
+
+def create_db_engine(url: Optional[str] = None, profile: Optional[str] = None) -> Engine:
+    """Crea el engine aplicando el perfil de rendimiento (PRAGMAs en SQLite, pool en servidores)."""
+    url = url or DATABASE_URL
+    pragmas, pool = _profile_settings(profile or DB_PROFILE)
+    if not url.startswith("sqlite"):
+        return create_engine(url, **pool)
+
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    _install_sqlite_pragmas(engine, pragmas)
+    return engine
+
+
+# Driver asincrono para cada backend: aiosqlite en local, asyncpg en Postgres (opcional,
+# `pip install asyncpg`). Con otros backends los endpoints async usan ThreadedSession.
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No hay driver asincrono configurado para {backend}")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def create_async_db_engine(url: Optional[str] = None, profile: Optional[str] = None) -> Optional[AsyncEngine]:
+    """Version asincrona de create_db_engine con el mismo perfil de rendimiento.
+
+    None si el backend no tiene driver asincrono o no esta instalado.
+    """
+    url = url or DATABASE_URL
+    pragmas, pool = _profile_settings(profile or DB_PROFILE)
+    backend = make_url(url).get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        return None
+    if not url.startswith("sqlite"):
+        try:
+            return create_async_engine(async_database_url(url), **pool)
+        except ImportError as e:
+            print(f"Driver asincrono no disponible para {backend} ({str(e)}): se usara la sesion sincrona")
+            return None
+
+    async_engine = create_async_engine(async_database_url(url))
+    _install_sqlite_pragmas(async_engine.sync_engine, pragmas)
+    return async_engine
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}) if DATABASE_URL.startswith("sqlite") else create_engine(DATABASE_URL)
+
+engine = create_db_engine()
+async_engine = create_async_db_engine()
+
+
+class ThreadedSession:
+    """Sesion sincrona con la parte de la interfaz de AsyncSession que usan los endpoints.
+
+    Sustituye a AsyncSession cuando no hay engine asincrono: cada consulta va al
+    threadpool y el resultado vuelve ya leido, sin tocar el cursor desde el bucle.
+    """
+
+    def __init__(self, bind: Engine):
+        self._session = Session(bind, expire_on_commit=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await run_in_threadpool(self._session.close)
+
+    async def execute(self, statement, params=None) -> Result:
+        frozen = await run_in_threadpool(lambda: self._session.execute(statement, params).freeze())
+        return frozen()
+
+    async def exec(self, statement):
+        result = await self.execute(statement)
+        return result.scalars() if isinstance(statement, SelectOfScalar) else result
+
+    async def get(self, model, ident):
+        return await run_in_threadpool(self._session.get, model, ident)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self._session, *args, **kwargs)
+
+
+def open_async_session():
+    """AsyncSession sobre async_engine, o ThreadedSession si el backend no tiene driver asincrono."""
+    if async_engine is None:
+        return ThreadedSession(engine)
+    return AsyncSession(async_engine, expire_on_commit=False)
 
 
 def get_session():
@@ -14,5 +197,38 @@ def get_session():
         yield session
 
 
+async def get_async_session():
+    """Yield an async database session for dependency injection."""
+    async with open_async_session() as session:
+        yield session
+
+
+def upsert_increment(session: Session, model, keys: dict, increments: dict, defaults: Optional[dict] = None) -> None:
+    """Suma `increments` a la fila de `model` con clave `keys`, creandola si no existe.
+
+    En SQLite y Postgres es un unico INSERT ... ON CONFLICT DO UPDATE, asi que dos
+    peticiones simultaneas no chocan creando la misma fila. `defaults` solo se usa
+    al insertar.
+    """
+    table = model.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(table).values(**keys, **increments, **(defaults or {}))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[name] for name in keys],
+            set_={name: table.c[name] + stmt.excluded[name] for name in increments},
+        )
+        session.execute(stmt)
+        return
+    row = session.get(model, tuple(keys.values()))
+    if row is None:
+        session.add(model(**keys, **increments, **(defaults or {})))
+        return
+    for name, delta in increments.items():
+        setattr(row, name, getattr(row, name) + delta)
+    session.add(row)
+
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
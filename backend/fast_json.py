@@ -0,0 +1,50 @@
+"""Respuestas JSON para listados grandes sin pasar cada fila por Pydantic.
+
+Los endpoints seleccionan columnas (tuplas, sin objetos ORM) y devuelven
+`FastJSONResponse(rows_as_dicts(result))`. El `response_model` de la ruta se mantiene
+para el esquema OpenAPI, pero FastAPI no valida ni serializa una Response ya hecha.
+El JSON es el mismo que el de Pydantic: mismas claves y en el mismo orden, fechas ISO
+(microsegundos solo si no son cero) y null para los vacios.
+"""
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List
+
+from fastapi.responses import Response
+from sqlalchemy.engine import Result
+
+try:
+    import orjson
+except ImportError:  # sin orjson se usa json de la libreria estandar, mas lento
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable a JSON: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def rows_as_dicts(rows, keys) -> List[Dict[str, Any]]:
+    """Filas de un select de columnas a dicts con las claves en el orden del select."""
+    keys = list(keys)
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def result_as_dicts(result: Result) -> List[Dict[str, Any]]:
+    return rows_as_dicts(result.all(), result.keys())
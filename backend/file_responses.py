@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+CHUNK_SIZE = 64 * 1024
+# Un unico rango de bytes: "bytes=0-99", "bytes=100-" o "bytes=-500"
+_BYTE_RANGE = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$", re.IGNORECASE)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def _parse_range(header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """Devuelve (inicio, fin) inclusivos para un unico rango `bytes=`; None si no aplica.
+
+    Una cabecera mal formada, de otra unidad o con varios rangos se ignora y se responde
+    con el fichero completo, como pide RFC 9110. ValueError solo para un rango valido
+    que no cae dentro del fichero (416).
+    """
+    match = _BYTE_RANGE.match(header)
+    if not match:
+        return None
+    start_text, end_text = match.groups()
+    if not start_text:
+        if not end_text:
+            return None
+        length = int(end_text)
+        if length == 0 or file_size == 0:
+            raise ValueError("rango vacio")
+        return max(file_size - length, 0), file_size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else file_size - 1
+    if end_text and end < start:
+        # Fin anterior al inicio: rango invalido, no insatisfacible
+        return None
+    if start >= file_size:
+        raise ValueError("rango fuera del fichero")
+    return start, min(end, file_size - 1)
+
+
+def _iter_file(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def cached_file_response(
+    request: Request,
+    path: Path,
+    filename: str,
+    etag: Optional[str] = None,
+    media_type: Optional[str] = None,
+) -> Response:
+    """FileResponse con ETag fuerte, 304 condicional y soporte de `Range` de un solo tramo.
+
+    `etag` debe identificar el contenido (hash); con el, la respuesta se marca como inmutable.
+    Sin el, se comporta como un FileResponse normal.
+    """
+    if etag is None:
+        return FileResponse(path, filename=filename, media_type=media_type)
+
+    quoted_etag = f'"{etag}"'
+    headers = {"ETag": quoted_etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, quoted_etag):
+        # El contenido no cambia nunca para este ETag: ni siquiera se mira el disco
+        return Response(status_code=304, headers=headers)
+
+    media_type = media_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == quoted_etag):
+        file_size = os.stat(path).st_size
+        try:
+            byte_range = _parse_range(range_header, file_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{file_size}"})
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            return StreamingResponse(
+                _iter_file(path, start, length),
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    **headers,
+                    "Content-Range": f"bytes {start}-{end}/{file_size}",
+                    "Content-Length": str(length),
+                },
+            )
+
+    return FileResponse(path, filename=filename, media_type=media_type, headers=headers)
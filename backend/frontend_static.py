@@ -0,0 +1,126 @@
+"""Sirve el build de Vite (frontend/dist) desde FastAPI, con variantes precomprimidas.
+
+Para generar las variantes .gz (y .br si esta instalado `brotli`) tras `npm run build`:
+    python frontend_static.py
+"""
+from __future__ import annotations
+
+import gzip
+import mimetypes
+import os
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+from file_responses import _etag_matches
+
+try:
+    import brotli
+except ImportError:  # sin brotli solo se generan y sirven las variantes gzip
+    brotli = None
+
+FRONTEND_DIST = Path(os.getenv("FRONTEND_DIST", Path(__file__).resolve().parent.parent / "frontend" / "dist")).resolve()
+# Vite pone un hash del contenido en el nombre de todo lo que hay en assets/
+HASHED_ASSETS_DIR = "assets"
+HASHED_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# (Accept-Encoding, sufijo del fichero precomprimido) por orden de preferencia
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_SUFFIXES = {".html", ".js", ".mjs", ".css", ".svg", ".json", ".map", ".txt", ".ico", ".webmanifest"}
+MIN_COMPRESS_SIZE = 1024
+
+
+def _accepted_encodings(request: Request) -> set:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.partition(";")
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class FrontendFiles:
+    """Ficheros estaticos del build con fallback a index.html para las rutas del router de React."""
+
+    def __init__(self, dist: Path = FRONTEND_DIST):
+        self.dist = dist
+        self.index = dist / "index.html"
+
+    @property
+    def available(self) -> bool:
+        return self.index.is_file()
+
+    def _resolve(self, asset_path: str) -> Optional[Path]:
+        candidate = (self.dist / asset_path).resolve()
+        if candidate != self.dist and self.dist not in candidate.parents:
+            return None
+        return candidate if candidate.is_file() else None
+
+    def response(self, request: Request, asset_path: str) -> Response:
+        path = self._resolve(asset_path) if asset_path else self.index
+        if path is None:
+            # Rutas del router de React (/vehiculos...) sin extension: se sirve la SPA
+            if "." in asset_path.rsplit("/", 1)[-1]:
+                return Response(status_code=404)
+            path = self.index
+
+        hashed = asset_path.startswith(f"{HASHED_ASSETS_DIR}/") and path != self.index
+        headers = {"Cache-Control": HASHED_CACHE_CONTROL if hashed else REVALIDATE_CACHE_CONTROL}
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+        served = path
+        accepted = _accepted_encodings(request)
+        has_variants = False
+        for encoding, suffix in ENCODINGS:
+            variant = path.with_name(path.name + suffix)
+            if variant.is_file():
+                has_variants = True
+                if encoding in accepted and served is path:
+                    served = variant
+                    headers["Content-Encoding"] = encoding
+        if has_variants:
+            headers["Vary"] = "Accept-Encoding"
+
+        stat = served.stat()
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        headers["ETag"] = etag
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return FileResponse(served, media_type=media_type, headers=headers, stat_result=stat)
+
+
+def precompress(dist: Path = FRONTEND_DIST) -> int:
+    """Escribe junto a cada fichero comprimible su variante .gz (y .br). Devuelve cuantas escribio."""
+    written = 0
+    for path in dist.rglob("*"):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        if len(data) < MIN_COMPRESS_SIZE:
+            continue
+        variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(data, quality=11)))
+        for suffix, compressed in variants:
+            target = path.with_name(path.name + suffix)
+            if len(compressed) >= len(data):
+                target.unlink(missing_ok=True)
+                continue
+            target.write_bytes(compressed)
+            written += 1
+    return written
+
+
+if __name__ == "__main__":
+    if not (FRONTEND_DIST / "index.html").is_file():
+        raise SystemExit(f"No hay build del frontend en {FRONTEND_DIST}: ejecuta antes npm run build")
+    print(f"Variantes precomprimidas escritas: {precompress()}")
@@ -0,0 +1,31 @@
+"""Borra del almacen de ficheros los blobs que ninguna fila referencia.
+
+Quedan al fallar una subida despues de escribir el fichero. Solo se borran los que
+llevan sin tocarse mas de BLOB_GC_GRACE_HOURS (24 por defecto), para no afectar a
+subidas en curso.
+
+Uso: python gc_blobs.py [--dry-run]
+"""
+from __future__ import annotations
+
+import sys
+from datetime import timedelta
+
+from sqlmodel import Session
+
+from main import BLOB_GC_GRACE_HOURS, engine, init_db, sweep_orphan_blobs
+
+
+def main():
+    dry_run = "--dry-run" in sys.argv[1:]
+    init_db()
+    with Session(engine) as session:
+        removed = sweep_orphan_blobs(session, timedelta(hours=BLOB_GC_GRACE_HOURS), dry_run=dry_run)
+    action = "Se borrarian" if dry_run else "Borrados"
+    print(f"{action} {len(removed)} blobs huerfanos")
+    for sha256 in removed:
+        print(sha256)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,59 @@
 from __future__ import annotations
 
+import asyncio
 import os
-import shutil
-from datetime import date, datetime
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Optional
 
-from fastapi import Depends, FastAPI, File, HTTPException, Query, UploadFile
+from fastapi import Depends, FastAPI, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
-from sqlmodel import Field, Session, SQLModel, create_engine, select
+from pydantic import ValidationError
+from sqlalchemy import Index, delete, func, insert, inspect, or_, text, tuple_
+from sqlalchemy.orm import relationship, selectinload
+from sqlmodel import Field, Relationship, Session, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import photo_derivatives
+import search
+from blob_store import BlobStore
+from bulk_import import check_utf8, detect_format, iter_records, spool_body
+from change_feed import (
+    CHANGE_FEED_LAG,
+    CHANGE_STREAM_POLL,
+    EPOCH_TOKEN,
+    ChangeNotifier,
+    decode_change_token,
+    encode_change_token,
+    install_tombstone_trigger,
+    sse_message,
+)
+from csv_export import stream_csv
+from db import async_engine, engine, get_async_session, get_session, open_async_session, upsert_increment
+from fast_json import FastJSONResponse, result_as_dicts, rows_as_dicts
+from file_responses import _etag_matches, cached_file_response
+from frontend_static import FrontendFiles
+from metrics import MetricsMiddleware, RequestMetrics, install_sql_hooks
+from migrations import MigrationRegistry, migrate
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from response_cache import ResponseCache, ResponseCacheMiddleware, SharedGenerations, seed_generations
+from slow_queries import SLOW_QUERY_LOG, SLOW_QUERY_MS, SlowQueryLog
+from sql_functions import DATE_BUCKETS, days_between, month_start
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///sahocars.db")
 STORAGE_ROOT = Path(os.getenv("STORAGE_ROOT", "storage")).resolve()
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+BULK_MAX_REPORTED_ERRORS = 1000
+PHOTO_LIMIT = 100
+PHOTO_UPLOAD_WORKERS = int(os.getenv("PHOTO_UPLOAD_WORKERS", "4"))
+# Horas que se respeta un blob sin fila antes de borrarlo (ver sweep_orphan_blobs)
+BLOB_GC_GRACE_HOURS = float(os.getenv("BLOB_GC_GRACE_HOURS", "24"))
+blob_store = BlobStore(STORAGE_ROOT / "blobs")
 
 
 class Branch(SQLModel, table=True):
@@ -29,6 +70,15 @@ class VehicleState(str):
 
 
 class Vehicle(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_vehicle_status_branch_created", "status", "branch_id", "created_at"),
+        Index("ix_vehicle_branch_purchase_date", "branch_id", "purchase_date"),
+        # Orden del listado por cursor sin filtros
+        Index("ix_vehicle_created_id", "created_at", "id"),
+        # Feed de cambios: filas con (updated_at, id) posterior al token
+        Index("ix_vehicle_updated_id", "updated_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     vin: Optional[str] = Field(default=None, index=True)
     license_plate: Optional[str] = Field(default=None, index=True)
@@ -48,8 +98,29 @@ class Vehicle(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+    # Se cargan con selectinload (ver /vehicles/{id}/full). Se declaran con relationship()
+    # explicito porque `from __future__ import annotations` impide a SQLModel leer List[...].
+    expenses: List["Expense"] = Relationship(
+        sa_relationship=relationship("Expense", order_by="Expense.expense_date.desc()", viewonly=True)
+    )
+    sale: Optional["Sale"] = Relationship(sa_relationship=relationship("Sale", uselist=False, viewonly=True))
+    documents: List["Document"] = Relationship(
+        sa_relationship=relationship("Document", order_by="Document.uploaded_at.desc()", viewonly=True)
+    )
+    photos: List["Photo"] = Relationship(
+        sa_relationship=relationship("Photo", order_by="[Photo.display_order, Photo.uploaded_at]", viewonly=True)
+    )
+    transfers: List["Transfer"] = Relationship(
+        sa_relationship=relationship("Transfer", order_by="[Transfer.transfer_date, Transfer.id]", viewonly=True)
+    )
+
 
 class Expense(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_expense_vehicle_date", "vehicle_id", "expense_date", "amount"),
+        Index("ix_expense_date_vehicle", "expense_date", "vehicle_id", "amount"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     vehicle_id: int = Field(foreign_key="vehicle.id")
     concept: str
@@ -60,6 +131,8 @@ class Expense(SQLModel, table=True):
 
 
 class Sale(SQLModel, table=True):
+    __table_args__ = (Index("ix_sale_date_price", "sale_date", "sale_price"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     vehicle_id: int = Field(foreign_key="vehicle.id", unique=True)
     sale_price: float
@@ -71,24 +144,39 @@ class Sale(SQLModel, table=True):
 
 
 class Document(SQLModel, table=True):
+    __table_args__ = (Index("ix_document_vehicle_uploaded", "vehicle_id", "uploaded_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     vehicle_id: int = Field(foreign_key="vehicle.id")
     doc_type: str
     file_name: str
     stored_path: str
+    sha256: Optional[str] = Field(default=None, index=True)
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
     notes: Optional[str] = None
 
 
 class Photo(SQLModel, table=True):
+    __table_args__ = (Index("ix_photo_vehicle_order", "vehicle_id", "display_order", "uploaded_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     vehicle_id: int = Field(foreign_key="vehicle.id")
     file_name: str
     stored_path: str
+    sha256: Optional[str] = Field(default=None, index=True)
     display_order: Optional[int] = None
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class Blob(SQLModel, table=True):
+    """Fichero almacenado por contenido; ref_count cuenta las filas Document/Photo que lo usan."""
+
+    sha256: str = Field(primary_key=True)
+    size: int
+    ref_count: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class VehicleCreate(SQLModel):
     vin: str
     license_plate: str
@@ -105,7 +193,29 @@ class VehicleCreate(SQLModel):
     notes: Optional[str] = None
 
 
+class VehicleUpdate(SQLModel):
+    """Campos editables con PATCH; valida los tipos (fechas ISO) antes de tocar el rollup."""
+
+    vin: Optional[str] = None
+    license_plate: Optional[str] = None
+    brand: Optional[str] = None
+    model: Optional[str] = None
+    version: Optional[str] = None
+    year: Optional[int] = None
+    km: Optional[int] = None
+    color: Optional[str] = None
+    branch_id: Optional[int] = None
+    status: Optional[str] = None
+    purchase_price: Optional[float] = None
+    sale_price: Optional[float] = None
+    purchase_date: Optional[date] = None
+    sale_date: Optional[date] = None
+    notes: Optional[str] = None
+
+
 class Transfer(SQLModel, table=True):
+    __table_args__ = (Index("ix_transfer_vehicle_date", "vehicle_id", "transfer_date"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     vehicle_id: int = Field(foreign_key="vehicle.id")
     from_branch_id: Optional[int] = Field(default=None, foreign_key="branch.id")
@@ -115,6 +225,25 @@ class Transfer(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class VehicleTombstone(SQLModel, table=True):
+    """Vehiculo borrado, para que /vehicles/changes pueda avisar a los clientes. Lo rellena un trigger."""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    vehicle_id: int
+    deleted_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class DashboardRollup(SQLModel, table=True):
+    """Totales del dashboard por sede y mes; branch_id 0 agrupa vehiculos sin sede."""
+
+    branch_id: int = Field(primary_key=True)
+    month: date = Field(primary_key=True)
+    income: float = 0.0
+    expense_total: float = 0.0
+    sale_count: int = 0
+    vehicle_count: int = 0
+
+
 class TransferCreate(SQLModel):
     from_branch_id: Optional[int] = Field(default=None, foreign_key="branch.id")
     to_branch_id: int = Field(foreign_key="branch.id")
@@ -122,6 +251,48 @@ class TransferCreate(SQLModel):
     notes: Optional[str] = None
 
 
+class VehicleCostSummary(SQLModel):
+    purchase_price: float
+    expenses_total: float
+    total_cost: float
+    sale_price: Optional[float] = None
+    margin: Optional[float] = None
+
+
+class VehicleFull(SQLModel):
+    vehicle: Vehicle
+    expenses: List[Expense]
+    sale: Optional[Sale] = None
+    documents: List[Document]
+    photos: List[Photo]
+    transfers: List[Transfer]
+    summary: VehicleCostSummary
+
+
+class VehicleChanges(SQLModel):
+    changes: List[Vehicle]
+    deleted: List[int]
+    token: str
+    has_more: bool = False
+
+
+class VehicleMarginRow(SQLModel):
+    vehicle_id: int
+    license_plate: Optional[str] = None
+    brand: Optional[str] = None
+    model: Optional[str] = None
+    branch_id: Optional[int] = None
+    status: Optional[str] = None
+    purchase_date: Optional[date] = None
+    sale_date: Optional[date] = None
+    purchase_price: float
+    expenses_total: float
+    total_cost: float
+    sale_price: Optional[float] = None
+    margin: Optional[float] = None
+    days_in_stock: Optional[int] = None
+
+
 class ExpenseCreate(SQLModel):
     concept: str
     amount: float
@@ -137,8 +308,38 @@ class SaleCreate(SQLModel):
     client_tax_id: Optional[str] = None
 
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}) if DATABASE_URL.startswith("sqlite") else create_engine(DATABASE_URL)
 app = FastAPI(title="Sahocars API", version="0.1.0")
+# Generaciones en la base de datos: con varios workers una escritura invalida la cache de todos
+response_cache = ResponseCache(shared=SharedGenerations(engine))
+frontend_files = FrontendFiles()
+change_notifier = ChangeNotifier()
+request_metrics = RequestMetrics()
+# Sin driver asincrono (async_engine None) todo pasa por el engine sincrono
+sql_engines = [engine] if async_engine is None else [engine, async_engine.sync_engine]
+for sql_engine in sql_engines:
+    install_sql_hooks(sql_engine)
+# Diagnostico opcional: solo con SLOW_QUERY_MS > 0
+slow_query_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_LOG) if SLOW_QUERY_MS > 0 else None
+if slow_query_log:
+    for sql_engine in sql_engines:
+        slow_query_log.install(sql_engine)
+
+# Cache de lecturas: ruta -> tablas cuyas escrituras la invalidan. Se registra antes
+# que CORS para quedar por dentro y no guardar cabeceras que dependen del Origin.
+CACHE_RULES = [
+    ("/branches", ("branch",)),
+    ("/dashboard", ("vehicle", "expense", "sale")),
+    ("/dashboard/series", ("vehicle", "expense", "sale")),
+    ("/reports/vehicle-margins", ("vehicle", "expense", "sale")),
+    ("/vehicles", ("vehicle",)),
+    ("/vehicles/search", ("vehicle",)),
+    ("/vehicles/[0-9]+", ("vehicle",)),
+    ("/vehicles/[0-9]+/expenses", ("expense",)),
+    ("/vehicles/[0-9]+/full", ("vehicle", "expense", "sale", "document", "photo", "transfer")),
+    ("/vehicles/[0-9]+/documents", ("document",)),
+    ("/vehicles/[0-9]+/photos", ("photo",)),
+]
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache, rules=CACHE_RULES)
 
 # Configurar CORS
 app.add_middleware(
@@ -147,21 +348,222 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Metricas por ruta: el ultimo middleware registrado es el mas externo, asi que
+# tambien mide los aciertos de cache y las respuestas de CORS.
+app.add_middleware(MetricsMiddleware, metrics=request_metrics, routes=app.router.routes)
+
+
+def _first_of_month(value: date) -> date:
+    return value.replace(day=1)
+
+
+def bump_dashboard_rollup(
+    session: Session,
+    branch_id: Optional[int],
+    day: date,
+    income: float = 0.0,
+    expense_total: float = 0.0,
+    sale_count: int = 0,
+    vehicle_count: int = 0,
+) -> None:
+    """Suma deltas a la fila (sede, mes) del rollup dentro de la transaccion en curso."""
+    upsert_increment(
+        session,
+        DashboardRollup,
+        keys={"branch_id": branch_id or 0, "month": _first_of_month(day)},
+        increments={
+            "income": income,
+            "expense_total": expense_total,
+            "sale_count": sale_count,
+            "vehicle_count": vehicle_count,
+        },
+    )
+
 
-def get_session():
-    with Session(engine) as session:
-        yield session
+def _vehicle_rollup_day(vehicle: Vehicle) -> date:
+    return vehicle.purchase_date or (vehicle.created_at or datetime.utcnow()).date()
+
+
+def apply_vehicle_to_rollup(session: Session, vehicle: Vehicle, sign: int = 1) -> None:
+    """Suma (sign=1) o resta (sign=-1) todo lo que aporta un vehiculo a su sede actual.
+
+    Se usa en traspasos y cambios de sede: se resta antes de cambiar branch_id y se
+    vuelve a sumar despues, recorriendo solo los gastos y la venta de ese vehiculo.
+    """
+    bump_dashboard_rollup(session, vehicle.branch_id, _vehicle_rollup_day(vehicle), vehicle_count=sign)
+    expense_rows = session.exec(
+        select(month_start(Expense.expense_date), func.sum(Expense.amount))
+        .where(Expense.vehicle_id == vehicle.id)
+        .group_by(month_start(Expense.expense_date))
+    ).all()
+    for month, amount in expense_rows:
+        bump_dashboard_rollup(session, vehicle.branch_id, month, expense_total=sign * amount)
+    sale = session.exec(select(Sale).where(Sale.vehicle_id == vehicle.id)).first()
+    if sale:
+        bump_dashboard_rollup(session, vehicle.branch_id, sale.sale_date, income=sign * sale.sale_price, sale_count=sign)
+
+
+def rebuild_dashboard_rollup(session: Session) -> int:
+    """Recalcula el rollup completo desde las tablas de origen. Devuelve las filas escritas."""
+    branch_key = func.coalesce(Vehicle.branch_id, 0)
+    totals: dict = {}
+
+    def bucket(branch_id, month):
+        return totals.setdefault(
+            (branch_id, month),
+            {"income": 0.0, "expense_total": 0.0, "sale_count": 0, "vehicle_count": 0},
+        )
+
+    purchase_month = month_start(func.coalesce(Vehicle.purchase_date, func.date(Vehicle.created_at)))
+    for branch_id, month, count in session.exec(
+        select(branch_key, purchase_month, func.count(Vehicle.id)).group_by(branch_key, purchase_month)
+    ):
+        bucket(branch_id, month)["vehicle_count"] += count
+
+    expense_month = month_start(Expense.expense_date)
+    for branch_id, month, amount in session.exec(
+        select(branch_key, expense_month, func.sum(Expense.amount))
+        .join(Vehicle, Vehicle.id == Expense.vehicle_id)
+        .group_by(branch_key, expense_month)
+    ):
+        bucket(branch_id, month)["expense_total"] += amount
+
+    sale_month = month_start(Sale.sale_date)
+    for branch_id, month, amount, count in session.exec(
+        select(branch_key, sale_month, func.sum(Sale.sale_price), func.count(Sale.id))
+        .join(Vehicle, Vehicle.id == Sale.vehicle_id)
+        .group_by(branch_key, sale_month)
+    ):
+        row = bucket(branch_id, month)
+        row["income"] += amount
+        row["sale_count"] += count
+
+    session.execute(delete(DashboardRollup))
+    session.add_all(
+        DashboardRollup(branch_id=branch_id, month=month, **values)
+        for (branch_id, month), values in totals.items()
+    )
+    session.commit()
+    return len(totals)
+
+
+def store_upload(session: Session, file: UploadFile) -> tuple:
+    """Guarda la subida en el almacen por contenido y suma una referencia al blob."""
+    sha256, size, path, _ = blob_store.put(file.file)
+    upsert_increment(session, Blob, keys={"sha256": sha256}, increments={"ref_count": 1}, defaults={"size": size})
+    return sha256, path
+
+
+def sweep_orphan_blobs(session: Session, grace: timedelta, dry_run: bool = False) -> List[str]:
+    """Borra los blobs en disco sin fila en Blob (o con ref_count 0) y mas antiguos que `grace`.
+
+    Una subida escribe el fichero antes de confirmar su fila, y si falla el fichero se
+    queda en disco. No se borra en la propia peticion porque otra subida del mismo
+    contenido puede estar usandolo sin haber confirmado aun; el periodo de gracia (put
+    renueva la fecha del fichero) cubre esas subidas en curso.
+    """
+    cutoff = time.time() - grace.total_seconds()
+    candidates = {sha256: path for sha256, path in blob_store.iter_blobs() if path.stat().st_mtime < cutoff}
+    shas = list(candidates)
+    referenced = set()
+    for start in range(0, len(shas), 500):
+        chunk = shas[start:start + 500]
+        referenced.update(session.exec(select(Blob.sha256).where(Blob.sha256.in_(chunk), Blob.ref_count > 0)).all())
+    removed = []
+    for sha256 in shas:
+        if sha256 in referenced:
+            continue
+        path = candidates[sha256]
+        try:
+            # Una subida del mismo contenido puede haberlo renovado mientras se consultaba la base
+            if path.stat().st_mtime >= cutoff:
+                continue
+            if not dry_run:
+                blob_store.discard(sha256)
+            removed.append(sha256)
+        except FileNotFoundError:
+            continue
+    return removed
+
+
+vehicle_fts_enabled = False
+
+
+schema_migrations = MigrationRegistry()
+
+
+@schema_migrations.register(1, "esquema base")
+def _migration_base_schema(connection):
+    SQLModel.metadata.create_all(connection)
+    # Bases anteriores: create_all no altera tablas existentes ni anade sus indices
+    inspector = inspect(connection)
+    for model, column in ((Document, "sha256"), (Photo, "sha256")):
+        table = model.__table__
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        if column not in existing:
+            column_type = table.c[column].type.compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column} {column_type}"))
+    for model in (Vehicle, Document, Photo):
+        for index in model.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+
+@schema_migrations.register(2, "busqueda FTS5 de vehiculos")
+def _migration_vehicle_fts(connection):
+    search.install_vehicle_fts(connection)
+
+
+@schema_migrations.register(3, "rollup del dashboard")
+def _migration_dashboard_rollup(connection):
+    with Session(bind=connection) as session:
+        has_rollup = session.exec(select(DashboardRollup.branch_id).limit(1)).first() is not None
+        has_vehicles = session.exec(select(Vehicle.id).limit(1)).first() is not None
+        if has_vehicles and not has_rollup:
+            rebuild_dashboard_rollup(session)
+
+
+@schema_migrations.register(4, "sedes iniciales")
+def _migration_default_branches(connection):
+    if connection.execute(select(Branch.id).limit(1)).first() is None:
+        connection.execute(insert(Branch), [{"name": "Montgat"}, {"name": "Juneda"}])
+
+
+@schema_migrations.register(5, "indices secundarios de tablas hijas y fechas")
+def _migration_secondary_indexes(connection):
+    for model in (Vehicle, Expense, Sale, Document, Photo, Transfer):
+        for index in model.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+
+@schema_migrations.register(6, "feed de cambios de vehiculos")
+def _migration_vehicle_change_feed(connection):
+    VehicleTombstone.__table__.create(connection, checkfirst=True)
+    for index in Vehicle.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    install_tombstone_trigger(connection)
+
+
+@schema_migrations.register(7, "generaciones compartidas de la cache de respuestas")
+def _migration_cache_generations(connection):
+    seed_generations(connection, {table for _, tables in CACHE_RULES for table in tables})
 
 
 def init_db():
-    SQLModel.metadata.create_all(engine)
-    with Session(engine) as session:
-        existing = session.exec(select(Branch)).all()
-        if not existing:
-            session.add_all([Branch(name="Montgat"), Branch(name="Juneda")])
-            session.commit()
+    """Aplica las migraciones pendientes; si el sello de version coincide no hay DDL."""
+    global vehicle_fts_enabled
+    started = time.perf_counter()
+    applied = migrate(engine, schema_migrations)
+    with engine.connect() as connection:
+        vehicle_fts_enabled = search.vehicle_fts_installed(connection)
+    elapsed = (time.perf_counter() - started) * 1000
+    if applied:
+        descriptions = ", ".join(f"{migration.version} {migration.description}" for migration in applied)
+        print(f"Migraciones aplicadas en {elapsed:.0f} ms: {descriptions}")
+    else:
+        print(f"Esquema al dia (version {schema_migrations.head}), comprobado en {elapsed:.1f} ms")
 
 
 @app.on_event("startup")
@@ -170,14 +572,20 @@ def on_startup():
     init_db()
 
 
+@app.on_event("shutdown")
+def on_shutdown():
+    photo_derivatives.shutdown()
+    response_cache.shared.close()
+
+
 @app.get("/health")
 def healthcheck():
     return {"status": "ok"}
 
 
 @app.get("/branches", response_model=List[Branch])
-def list_branches(session: Session = Depends(get_session)):
-    return session.exec(select(Branch)).all()
+async def list_branches(session: AsyncSession = Depends(get_async_session)):
+    return (await session.exec(select(Branch))).all()
 
 
 @app.post("/vehicles", response_model=Vehicle)
@@ -194,7 +602,10 @@ def create_vehicle(vehicle_data: VehicleCreate, session: Session = Depends(get_s
         vehicle.created_at = datetime.utcnow()
         vehicle.updated_at = datetime.utcnow()
         session.add(vehicle)
+        bump_dashboard_rollup(session, vehicle.branch_id, _vehicle_rollup_day(vehicle), vehicle_count=1)
         session.commit()
+        response_cache.invalidate("vehicle")
+        change_notifier.notify()
         session.refresh(vehicle)
         return vehicle
     except Exception as e:
@@ -203,16 +614,134 @@ def create_vehicle(vehicle_data: VehicleCreate, session: Session = Depends(get_s
         raise HTTPException(status_code=400, detail=f"Error al crear vehículo: {str(e)}")
 
 
+def _bulk_vehicle_row(record: dict) -> dict:
+    data = VehicleCreate.model_validate(record).model_dump()
+    data["purchase_date"] = datetime.fromisoformat(data["purchase_date"]).date()
+    data["status"] = data["status"] or VehicleState.PENDING
+    return data
+
+
+def _insert_vehicle_batch(session: Session, rows: List[dict]) -> None:
+    """Inserta el lote con un unico executemany y suma los vehiculos al rollup del dashboard."""
+    # Fecha del propio lote, no la del inicio de la importacion: el feed de cambios
+    # ya puede haber dado tokens posteriores al inicio mientras se procesaban otros lotes
+    now = datetime.utcnow()
+    for row in rows:
+        row["created_at"] = now
+        row["updated_at"] = now
+    session.execute(insert(Vehicle.__table__), rows)
+    per_month = Counter((row["branch_id"], _first_of_month(row["purchase_date"])) for row in rows)
+    for (branch_id, month), count in per_month.items():
+        bump_dashboard_rollup(session, branch_id, month, vehicle_count=count)
+
+
+def import_vehicles(source, fmt: str, batch_size: int) -> dict:
+    """Importa vehiculos desde CSV/NDJSON en transacciones de `batch_size` filas.
+
+    Las filas invalidas no detienen la importacion: se devuelven en el informe de errores.
+    Si un lote falla en la base de datos se reintenta fila a fila para aislar la culpable.
+    """
+    started = time.perf_counter()
+    inserted = 0
+    failed = 0
+    errors: List[dict] = []
+    batch: List[tuple] = []
+
+    def report(line: int, messages: List[str]):
+        nonlocal failed
+        failed += 1
+        if len(errors) < BULK_MAX_REPORTED_ERRORS:
+            errors.append({"line": line, "errors": messages})
+
+    with Session(engine) as session:
+        branch_ids = set(session.exec(select(Branch.id)).all())
+
+        def flush():
+            nonlocal inserted
+            if not batch:
+                return
+            before = inserted
+            try:
+                _insert_vehicle_batch(session, [row for _, row in batch])
+                session.commit()
+                inserted += len(batch)
+            except Exception:
+                session.rollback()
+                for line, row in batch:
+                    try:
+                        _insert_vehicle_batch(session, [row])
+                        session.commit()
+                        inserted += 1
+                    except Exception as e:
+                        session.rollback()
+                        report(line, [str(e)])
+            batch.clear()
+            if inserted > before:
+                # Cada lote confirmado ya es visible: se avisa sin esperar al final
+                response_cache.invalidate("vehicle")
+                change_notifier.notify()
+
+        for line, record in iter_records(source, fmt):
+            if isinstance(record, Exception):
+                report(line, [f"JSON no valido: {record}"])
+                continue
+            if not isinstance(record, dict):
+                report(line, ["Cada fila debe ser un objeto"])
+                continue
+            try:
+                row = _bulk_vehicle_row(record)
+            except ValidationError as e:
+                report(line, [f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()])
+                continue
+            except ValueError as e:
+                report(line, [f"purchase_date: {e}"])
+                continue
+            if row["branch_id"] not in branch_ids:
+                report(line, [f"branch_id: la sede {row['branch_id']} no existe"])
+                continue
+            batch.append((line, row))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "inserted": inserted,
+        "failed": failed,
+        "errors": errors,
+        "errors_truncated": failed > len(errors),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round((inserted + failed) / elapsed, 1) if elapsed else None,
+    }
+
+
+@app.post("/vehicles/bulk")
+async def bulk_create_vehicles(
+    request: Request,
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$", description="csv o ndjson; por defecto segun Content-Type"),
+    batch_size: int = Query(BULK_BATCH_SIZE, ge=1, le=10000, description="filas por transaccion"),
+):
+    fmt = detect_format(request, fmt)
+    source = await spool_body(request)
+    try:
+        await run_in_threadpool(check_utf8, source)
+        return await run_in_threadpool(import_vehicles, source, fmt, batch_size)
+    finally:
+        source.close()
+
+
 @app.get("/vehicles", response_model=List[Vehicle])
-def list_vehicles(
+async def list_vehicles(
     state: Optional[str] = None,
     branch_id: Optional[int] = None,
     from_date: Optional[date] = Query(None, description="filter by purchase date >="),
     to_date: Optional[date] = Query(None, description="filter by purchase date <="),
-    session: Session = Depends(get_session),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="tamano de pagina; sin limite si se omite"),
+    cursor: Optional[str] = Query(None, description=f"valor de la cabecera {NEXT_CURSOR_HEADER} de la pagina anterior"),
+    session: AsyncSession = Depends(get_async_session),
 ):
     try:
-        query = select(Vehicle)
+        query = select(*Vehicle.__table__.columns)
         if state:
             query = query.where(Vehicle.status == state)
         if branch_id:
@@ -221,34 +750,233 @@ def list_vehicles(
             query = query.where(Vehicle.purchase_date >= from_date)
         if to_date:
             query = query.where(Vehicle.purchase_date <= to_date)
-        query = query.order_by(Vehicle.created_at.desc())
-        return session.exec(query).all()
+        if cursor:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+            query = query.where(tuple_(Vehicle.created_at, Vehicle.id) < (cursor_created_at, cursor_id))
+        query = query.order_by(Vehicle.created_at.desc(), Vehicle.id.desc())
+        if limit is None:
+            return FastJSONResponse(result_as_dicts(await session.execute(query)))
+        result = await session.execute(query.limit(limit + 1))
+        vehicles = result.all()
+        headers = {}
+        if len(vehicles) > limit:
+            vehicles = vehicles[:limit]
+            headers[NEXT_CURSOR_HEADER] = encode_cursor(vehicles[-1].created_at, vehicles[-1].id)
+        return FastJSONResponse(rows_as_dicts(vehicles, result.keys()), headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error en list_vehicles: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al listar vehículos: {str(e)}")
 
 
+@app.get("/vehicles/search", response_model=List[Vehicle])
+async def search_vehicles(
+    q: str = Query(..., min_length=3, description="fragmento de matricula, VIN, marca, modelo o notas"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    session: AsyncSession = Depends(get_async_session),
+):
+    match = search.build_match_query(q)
+    if vehicle_fts_enabled and match:
+        statement = select(Vehicle).from_statement(text(search.ranked_search_sql()))
+        result = await session.execute(statement, {"match": match, "limit": limit, "offset": offset})
+        return result.scalars().all()
+    # Sin FTS5 (Postgres o SQLite antiguo): busqueda por subcadena sin ranking
+    pattern = f"%{q.strip()}%"
+    query = (
+        select(Vehicle)
+        .where(
+            or_(
+                Vehicle.license_plate.ilike(pattern),
+                Vehicle.vin.ilike(pattern),
+                Vehicle.brand.ilike(pattern),
+                Vehicle.model.ilike(pattern),
+                Vehicle.version.ilike(pattern),
+                Vehicle.notes.ilike(pattern),
+            )
+        )
+        .order_by(Vehicle.created_at.desc(), Vehicle.id.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+    return (await session.exec(query)).all()
+
+
+async def _latest_change_key(session: AsyncSession):
+    latest = (
+        await session.exec(select(Vehicle.updated_at, Vehicle.id).order_by(Vehicle.updated_at.desc(), Vehicle.id.desc()).limit(1))
+    ).first()
+    tombstone_id = (await session.exec(select(func.max(VehicleTombstone.id)))).one() or 0
+    updated_at, vehicle_id = latest if latest else EPOCH_TOKEN[:2]
+    return updated_at, vehicle_id, tombstone_id
+
+
+@app.get("/vehicles/changes", response_model=VehicleChanges)
+async def vehicle_changes(
+    since: Optional[str] = Query(None, description="token de la llamada anterior; sin el solo se devuelve el token actual"),
+    limit: int = Query(500, ge=1, le=5000),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Vehiculos creados o modificados y ids borrados desde `since`.
+
+    Una fila puede llegar repetida en llamadas consecutivas (ver CHANGE_FEED_LAG): el
+    cliente debe fusionar por id. Con `has_more` hay que volver a llamar con el nuevo token.
+    """
+    try:
+        horizon = (datetime.utcnow() - timedelta(seconds=CHANGE_FEED_LAG), 0)
+        if since is None:
+            updated_at, vehicle_id, tombstone_id = await _latest_change_key(session)
+            position = min((updated_at, vehicle_id), horizon)
+            return VehicleChanges(changes=[], deleted=[], token=encode_change_token(*position, tombstone_id))
+
+        since_updated_at, since_vehicle_id, tombstone_id = decode_change_token(since)
+        query = (
+            select(*Vehicle.__table__.columns)
+            .where(tuple_(Vehicle.updated_at, Vehicle.id) > (since_updated_at, since_vehicle_id))
+            .order_by(Vehicle.updated_at, Vehicle.id)
+            .limit(limit + 1)
+        )
+        result = await session.execute(query)
+        vehicles = result.all()
+        has_more = len(vehicles) > limit
+        vehicles = vehicles[:limit]
+        tombstones = (
+            await session.exec(
+                select(VehicleTombstone.id, VehicleTombstone.vehicle_id)
+                .where(VehicleTombstone.id > tombstone_id)
+                .order_by(VehicleTombstone.id)
+            )
+        ).all()
+
+        position = (since_updated_at, since_vehicle_id)
+        if vehicles:
+            position = (vehicles[-1].updated_at, vehicles[-1].id)
+        if not has_more:
+            # Lo mas reciente se vuelve a enviar en la siguiente llamada por si hay
+            # transacciones con un updated_at anterior aun sin confirmar
+            position = max(min(position, horizon), (since_updated_at, since_vehicle_id))
+        if tombstones:
+            tombstone_id = tombstones[-1].id
+        return FastJSONResponse(
+            {
+                "changes": rows_as_dicts(vehicles, result.keys()),
+                "deleted": [vehicle_id for _, vehicle_id in tombstones],
+                "token": encode_change_token(*position, tombstone_id),
+                "has_more": has_more,
+            }
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error en vehicle_changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error al obtener cambios de vehículos: {str(e)}")
+
+
+@app.get("/vehicles/changes/stream")
+async def vehicle_changes_stream(request: Request):
+    """Server-Sent Events: un evento `changes` cada vez que cambian los vehiculos.
+
+    Los avisos de este proceso llegan al momento; los de otros workers, en cuanto el
+    stream mira la base de datos (cada CHANGE_STREAM_POLL segundos).
+    """
+
+    async def events():
+        subscriber = change_notifier.subscribe()
+        wake = subscriber[1]
+        last_key = None
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                async with open_async_session() as session:
+                    key = await _latest_change_key(session)
+                if last_key is not None and key != last_key:
+                    yield sse_message({"latest": key[0].isoformat()}, event="changes")
+                else:
+                    yield ": keepalive\n\n"
+                last_key = key
+                try:
+                    await asyncio.wait_for(wake.wait(), CHANGE_STREAM_POLL)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+        finally:
+            change_notifier.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/vehicles/{vehicle_id}", response_model=Vehicle)
-def get_vehicle(vehicle_id: int, session: Session = Depends(get_session)):
-    vehicle = session.get(Vehicle, vehicle_id)
+async def get_vehicle(vehicle_id: int, session: AsyncSession = Depends(get_async_session)):
+    vehicle = await session.get(Vehicle, vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehiculo no encontrado")
     return vehicle
 
 
+@app.get("/vehicles/{vehicle_id}/full", response_model=VehicleFull)
+async def get_vehicle_full(vehicle_id: int, session: AsyncSession = Depends(get_async_session)):
+    """Vehiculo con gastos, venta, documentos, fotos y traspasos en 6 consultas fijas."""
+    query = (
+        select(Vehicle)
+        .where(Vehicle.id == vehicle_id)
+        .options(
+            selectinload(Vehicle.expenses),
+            selectinload(Vehicle.sale),
+            selectinload(Vehicle.documents),
+            selectinload(Vehicle.photos),
+            selectinload(Vehicle.transfers),
+        )
+    )
+    vehicle = (await session.exec(query)).first()
+    if not vehicle:
+        raise HTTPException(status_code=404, detail="Vehiculo no encontrado")
+    purchase_price = vehicle.purchase_price or 0.0
+    expenses_total = sum(expense.amount for expense in vehicle.expenses)
+    total_cost = purchase_price + expenses_total
+    sale_price = vehicle.sale.sale_price if vehicle.sale else vehicle.sale_price
+    return VehicleFull(
+        vehicle=vehicle,
+        expenses=vehicle.expenses,
+        sale=vehicle.sale,
+        documents=vehicle.documents,
+        photos=vehicle.photos,
+        transfers=vehicle.transfers,
+        summary=VehicleCostSummary(
+            purchase_price=purchase_price,
+            expenses_total=expenses_total,
+            total_cost=total_cost,
+            sale_price=sale_price,
+            margin=sale_price - total_cost if sale_price is not None else None,
+        ),
+    )
+
+
 @app.patch("/vehicles/{vehicle_id}", response_model=Vehicle)
-def update_vehicle(vehicle_id: int, data: Vehicle, session: Session = Depends(get_session)):
+def update_vehicle(vehicle_id: int, data: VehicleUpdate, session: Session = Depends(get_session)):
     vehicle = session.get(Vehicle, vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehiculo no encontrado")
     update_data = data.model_dump(exclude_unset=True)
-    update_data.pop("id", None)
-    update_data.pop("created_at", None)
+    moves_rollup = any(
+        key in update_data and update_data[key] != getattr(vehicle, key)
+        for key in ("branch_id", "purchase_date")
+    )
+    if moves_rollup:
+        apply_vehicle_to_rollup(session, vehicle, sign=-1)
     for key, value in update_data.items():
         setattr(vehicle, key, value)
+    if moves_rollup:
+        apply_vehicle_to_rollup(session, vehicle, sign=1)
     vehicle.updated_at = datetime.utcnow()
     session.add(vehicle)
     session.commit()
+    response_cache.invalidate("vehicle")
+    change_notifier.notify()
     session.refresh(vehicle)
     return vehicle
 
@@ -264,26 +992,35 @@ def transfer_vehicle(
         raise HTTPException(status_code=404, detail="Vehiculo no encontrado")
     transfer_record = Transfer(vehicle_id=vehicle_id, **transfer.model_dump())
     session.add(transfer_record)
-    vehicle.branch_id = transfer_record.to_branch_id
+    if vehicle.branch_id != transfer_record.to_branch_id:
+        apply_vehicle_to_rollup(session, vehicle, sign=-1)
+        vehicle.branch_id = transfer_record.to_branch_id
+        apply_vehicle_to_rollup(session, vehicle, sign=1)
     vehicle.updated_at = datetime.utcnow()
     session.add(vehicle)
     session.commit()
+    response_cache.invalidate("vehicle", "transfer")
+    change_notifier.notify()
     session.refresh(transfer_record)
     return transfer_record
 
 
 @app.get("/vehicles/{vehicle_id}/expenses", response_model=List[Expense])
-def list_expenses(vehicle_id: int, session: Session = Depends(get_session)):
-    return session.exec(select(Expense).where(Expense.vehicle_id == vehicle_id).order_by(Expense.expense_date.desc())).all()
+async def list_expenses(vehicle_id: int, session: AsyncSession = Depends(get_async_session)):
+    query = select(*Expense.__table__.columns).where(Expense.vehicle_id == vehicle_id).order_by(Expense.expense_date.desc())
+    return FastJSONResponse(result_as_dicts(await session.execute(query)))
 
 
 @app.post("/vehicles/{vehicle_id}/expenses", response_model=Expense)
 def add_expense(vehicle_id: int, expense: ExpenseCreate, session: Session = Depends(get_session)):
-    if not session.get(Vehicle, vehicle_id):
+    vehicle = session.get(Vehicle, vehicle_id)
+    if not vehicle:
         raise HTTPException(status_code=404, detail="Vehiculo no encontrado")
     expense_record = Expense(vehicle_id=vehicle_id, **expense.model_dump())
     session.add(expense_record)
+    bump_dashboard_rollup(session, vehicle.branch_id, expense_record.expense_date, expense_total=expense_record.amount)
     session.commit()
+    response_cache.invalidate("expense")
     session.refresh(expense_record)
     return expense_record
 
@@ -296,11 +1033,14 @@ def register_sale(vehicle_id: int, sale: SaleCreate, session: Session = Depends(
     sale_record = Sale(vehicle_id=vehicle_id, **sale.model_dump())
     vehicle.sale_price = sale_record.sale_price
     vehicle.sale_date = sale_record.sale_date
-    vehicle.state = VehicleState.SOLD
+    vehicle.status = VehicleState.SOLD
     vehicle.updated_at = datetime.utcnow()
     session.add(sale_record)
     session.add(vehicle)
+    bump_dashboard_rollup(session, vehicle.branch_id, sale_record.sale_date, income=sale_record.sale_price, sale_count=1)
     session.commit()
+    response_cache.invalidate("sale", "vehicle")
+    change_notifier.notify()
     session.refresh(sale_record)
     return sale_record
 
@@ -321,21 +1061,19 @@ def upload_document(
     vehicle = session.get(Vehicle, vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehiculo no encontrado")
-    storage_path = STORAGE_ROOT / "vehiculos" / str(vehicle_id) / "documentos"
-    storage_path.mkdir(parents=True, exist_ok=True)
     safe_name = os.path.basename(file.filename)
-    destination = storage_path / safe_name
-    with destination.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    sha256, destination = store_upload(session, file)
     record = Document(
         vehicle_id=vehicle_id,
         doc_type=doc_type,
         file_name=safe_name,
         stored_path=str(destination),
+        sha256=sha256,
         notes=notes,
     )
     session.add(record)
     session.commit()
+    response_cache.invalidate("document")
     session.refresh(record)
     return record
 
@@ -355,171 +1093,520 @@ def upload_photo(
     vehicle = session.get(Vehicle, vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehiculo no encontrado")
-    existing_count = len(session.exec(select(Photo).where(Photo.vehicle_id == vehicle_id)).all())
-    if existing_count >= 100:
-        raise HTTPException(status_code=400, detail="Limite de 100 fotos alcanzado")
-    storage_path = STORAGE_ROOT / "vehiculos" / str(vehicle_id) / "fotos"
-    storage_path.mkdir(parents=True, exist_ok=True)
+    existing_count = session.exec(select(func.count(Photo.id)).where(Photo.vehicle_id == vehicle_id)).one()
+    if existing_count >= PHOTO_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Limite de {PHOTO_LIMIT} fotos alcanzado")
     safe_name = os.path.basename(file.filename)
-    destination = storage_path / safe_name
-    with destination.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    sha256, destination = store_upload(session, file)
     photo = Photo(
         vehicle_id=vehicle_id,
         file_name=safe_name,
         stored_path=str(destination),
+        sha256=sha256,
         display_order=display_order,
     )
     session.add(photo)
     session.commit()
+    response_cache.invalidate("photo")
     session.refresh(photo)
+    photo_derivatives.schedule_derivatives(destination)
     return photo
 
 
+@app.post("/vehicles/{vehicle_id}/photos/batch", response_model=List[Photo])
+def upload_photos(
+    vehicle_id: int,
+    files: List[UploadFile] = File(...),
+    display_order: Optional[int] = Query(None, description="orden de la primera foto; por defecto despues de la ultima"),
+    session: Session = Depends(get_session),
+):
+    vehicle = session.get(Vehicle, vehicle_id)
+    if not vehicle:
+        raise HTTPException(status_code=404, detail="Vehiculo no encontrado")
+    existing_count, max_order = session.exec(
+        select(func.count(Photo.id), func.max(Photo.display_order)).where(Photo.vehicle_id == vehicle_id)
+    ).one()
+    if existing_count + len(files) > PHOTO_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Limite de {PHOTO_LIMIT} fotos: quedan {max(PHOTO_LIMIT - existing_count, 0)} y se han enviado {len(files)}",
+        )
+    # Hash y copia a disco en paralelo; las filas se insertan despues en una sola transaccion
+    with ThreadPoolExecutor(max_workers=min(PHOTO_UPLOAD_WORKERS, len(files))) as pool:
+        stored = list(pool.map(lambda upload: blob_store.put(upload.file), files))
+    references = Counter()
+    sizes = {}
+    for sha256, size, _, _ in stored:
+        references[sha256] += 1
+        sizes[sha256] = size
+    for sha256, count in references.items():
+        upsert_increment(session, Blob, keys={"sha256": sha256}, increments={"ref_count": count}, defaults={"size": sizes[sha256]})
+    first_order = display_order if display_order is not None else (max_order + 1 if max_order is not None else existing_count)
+    photos = [
+        Photo(
+            vehicle_id=vehicle_id,
+            file_name=os.path.basename(upload.filename),
+            stored_path=str(path),
+            sha256=sha256,
+            display_order=first_order + position,
+        )
+        for position, (upload, (sha256, _, path, _)) in enumerate(zip(files, stored))
+    ]
+    session.add_all(photos)
+    session.commit()
+    response_cache.invalidate("photo")
+    for photo in photos:
+        session.refresh(photo)
+    for path in {path for _, _, path, _ in stored}:
+        photo_derivatives.schedule_derivatives(path)
+    return photos
+
+
+# Documentos y fotos no se editan tras subirse, asi que la fila -> fichero se puede
+# cachear sin invalidacion. Los ids inexistentes lanzan excepcion y no se cachean.
+FILE_LOOKUP_CACHE_SIZE = int(os.getenv("FILE_LOOKUP_CACHE_SIZE", "4096"))
+
+
+@lru_cache(maxsize=FILE_LOOKUP_CACHE_SIZE)
+def _document_file(document_id: int) -> tuple:
+    with Session(engine) as session:
+        document = session.get(Document, document_id)
+        if not document:
+            raise HTTPException(status_code=404, detail="Documento no encontrado")
+        return document.stored_path, document.file_name, document.sha256
+
+
+@lru_cache(maxsize=FILE_LOOKUP_CACHE_SIZE)
+def _photo_file(photo_id: int) -> tuple:
+    with Session(engine) as session:
+        photo = session.get(Photo, photo_id)
+        if not photo:
+            raise HTTPException(status_code=404, detail="Foto no encontrada")
+        return photo.stored_path, photo.file_name, photo.sha256
+
+
 @app.get("/documents/{document_id}")
-def download_document(document_id: int, session: Session = Depends(get_session)):
-    document = session.get(Document, document_id)
-    if not document:
-        raise HTTPException(status_code=404, detail="Documento no encontrado")
-    return FileResponse(document.stored_path, filename=document.file_name)
+def download_document(document_id: int, request: Request):
+    stored_path, file_name, sha256 = _document_file(document_id)
+    return cached_file_response(request, Path(stored_path), file_name, etag=sha256)
 
 
 @app.get("/photos/{photo_id}")
-def download_photo(photo_id: int, session: Session = Depends(get_session)):
-    photo = session.get(Photo, photo_id)
-    if not photo:
-        raise HTTPException(status_code=404, detail="Foto no encontrada")
-    return FileResponse(photo.stored_path, filename=photo.file_name)
+def download_photo(
+    photo_id: int,
+    request: Request,
+    size: str = Query("original", pattern="^(thumb|medium|original)$", description="thumb, medium u original"),
+):
+    stored_path, file_name, sha256 = _photo_file(photo_id)
+    if size != "original":
+        etag = f"{sha256}-{size}" if sha256 else None
+        if_none_match = request.headers.get("if-none-match")
+        if etag and if_none_match and _etag_matches(if_none_match, f'"{etag}"'):
+            # Revalidacion: se responde 304 sin comprobar si la variante existe en disco
+            return cached_file_response(request, Path(stored_path), file_name, etag=etag)
+        # Normalmente ya la ha generado el worker tras la subida; si no, se genera ahora
+        derivative = photo_derivatives.ensure_derivative(Path(stored_path), size)
+        if derivative:
+            return cached_file_response(
+                request,
+                derivative,
+                f"{Path(file_name).stem}-{size}.jpg",
+                etag=etag,
+                media_type="image/jpeg",
+            )
+    return cached_file_response(request, Path(stored_path), file_name, etag=sha256)
+
+
+def _raw_totals(
+    session: Session,
+    from_date: Optional[date],
+    to_date: Optional[date],
+    branch_id: Optional[int],
+) -> tuple:
+    sale_query = select(func.coalesce(func.sum(Sale.sale_price), 0.0)).select_from(Sale)
+    if branch_id:
+        sale_query = sale_query.join(Vehicle, Vehicle.id == Sale.vehicle_id).where(Vehicle.branch_id == branch_id)
+    if from_date:
+        sale_query = sale_query.where(Sale.sale_date >= from_date)
+    if to_date:
+        sale_query = sale_query.where(Sale.sale_date <= to_date)
+    income = float(session.exec(sale_query).one())
+
+    expense_query = select(func.coalesce(func.sum(Expense.amount), 0.0)).select_from(Expense)
+    if branch_id:
+        expense_query = expense_query.join(Vehicle, Vehicle.id == Expense.vehicle_id).where(Vehicle.branch_id == branch_id)
+    if from_date:
+        expense_query = expense_query.where(Expense.expense_date >= from_date)
+    if to_date:
+        expense_query = expense_query.where(Expense.expense_date <= to_date)
+    expense_total = float(session.exec(expense_query).one())
+    return income, expense_total
+
+
+def _rollup_totals(
+    session: Session,
+    from_month: Optional[date],
+    to_month: Optional[date],
+    branch_id: Optional[int],
+) -> tuple:
+    query = select(
+        func.coalesce(func.sum(DashboardRollup.income), 0.0),
+        func.coalesce(func.sum(DashboardRollup.expense_total), 0.0),
+    )
+    if branch_id:
+        query = query.where(DashboardRollup.branch_id == branch_id)
+    if from_month:
+        query = query.where(DashboardRollup.month >= from_month)
+    if to_month:
+        query = query.where(DashboardRollup.month <= to_month)
+    income, expense_total = session.exec(query).one()
+    return float(income), float(expense_total)
+
+
+def _whole_months(from_date: Optional[date], to_date: Optional[date]) -> tuple:
+    """Devuelve (primer_mes, ultimo_mes) completos dentro del rango; None = sin limite."""
+    first = None
+    if from_date:
+        first = from_date if from_date.day == 1 else _first_of_month(_first_of_month(from_date) + timedelta(days=32))
+    last = None
+    if to_date:
+        next_day = to_date + timedelta(days=1)
+        last = _first_of_month(to_date) if next_day.day == 1 else _first_of_month(_first_of_month(to_date) - timedelta(days=1))
+    return first, last
+
+
+def compute_dashboard(
+    session: Session,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    branch_id: Optional[int] = None,
+) -> dict:
+    """Totales del dashboard.
+
+    Los meses completos del rango salen de DashboardRollup; los dias sueltos del
+    principio y del final se suman sobre Sale/Expense con agregados SQL.
+    """
+    vehicles_query = select(func.coalesce(func.sum(DashboardRollup.vehicle_count), 0))
+    if branch_id:
+        vehicles_query = vehicles_query.where(DashboardRollup.branch_id == branch_id)
+    vehicle_count = int(session.exec(vehicles_query).one())
+
+    first_month, last_month = _whole_months(from_date, to_date)
+    if first_month and last_month and first_month > last_month:
+        income, expense_total = _raw_totals(session, from_date, to_date, branch_id)
+    else:
+        income, expense_total = _rollup_totals(session, first_month, last_month, branch_id)
+        if from_date and first_month != from_date:
+            head = _raw_totals(session, from_date, first_month - timedelta(days=1), branch_id)
+            income, expense_total = income + head[0], expense_total + head[1]
+        if to_date and _first_of_month(to_date) != last_month:
+            tail = _raw_totals(session, _first_of_month(to_date), to_date, branch_id)
+            income, expense_total = income + tail[0], expense_total + tail[1]
+
+    return {
+        "vehicles": vehicle_count,
+        "income": income,
+        "expenses": expense_total,
+        "margin": income - expense_total,
+    }
+
+
+def compute_dashboard_series(
+    session: Session,
+    bucket: str = "month",
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    branch_id: Optional[int] = None,
+    group_by_branch: bool = False,
+) -> List[dict]:
+    """Series del dashboard agrupadas por periodo (y sede): una consulta agrupada por metrica.
+
+    Igual que en compute_dashboard, ventas y gastos cuentan en la sede actual del vehiculo.
+    """
+    truncate = DATE_BUCKETS[bucket]
+    points: dict = {}
+
+    def point(period, branch):
+        key = (period, branch if group_by_branch else None)
+        return points.setdefault(key, {"income": 0.0, "expenses": 0.0, "sales": 0, "stock_intake": 0})
+
+    def grouped(date_column, *aggregates, join_vehicle: bool):
+        period = truncate(date_column)
+        keys = [period, Vehicle.branch_id] if group_by_branch else [period]
+        query = select(*keys, *aggregates)
+        if join_vehicle:
+            query = query.join(Vehicle, Vehicle.id == date_column.class_.vehicle_id)
+        if branch_id:
+            query = query.where(Vehicle.branch_id == branch_id)
+        if from_date:
+            query = query.where(date_column >= from_date)
+        if to_date:
+            query = query.where(date_column <= to_date)
+        query = query.where(date_column.isnot(None)).group_by(*keys)
+        for row in session.exec(query):
+            yield (row[0], row[1] if group_by_branch else None), row[len(keys):]
+
+    for (period, branch), (income, sales) in grouped(
+        Sale.sale_date, func.sum(Sale.sale_price), func.count(Sale.id), join_vehicle=True
+    ):
+        values = point(period, branch)
+        values["income"] = float(income or 0.0)
+        values["sales"] = sales
+    for (period, branch), (amount,) in grouped(Expense.expense_date, func.sum(Expense.amount), join_vehicle=True):
+        point(period, branch)["expenses"] = float(amount or 0.0)
+    for (period, branch), (count,) in grouped(Vehicle.purchase_date, func.count(Vehicle.id), join_vehicle=False):
+        point(period, branch)["stock_intake"] = count
+
+    series = []
+    for (period, branch), values in sorted(points.items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+        entry = {"period": period}
+        if group_by_branch:
+            entry["branch_id"] = branch
+        entry.update(values)
+        entry["margin"] = values["income"] - values["expenses"]
+        series.append(entry)
+    return series
+
+
+@app.get("/dashboard/series")
+async def dashboard_series(
+    bucket: str = Query("month", pattern="^(day|week|month)$"),
+    from_date: Optional[date] = Query(None),
+    to_date: Optional[date] = Query(None),
+    branch_id: Optional[int] = Query(None),
+    group_by: Optional[str] = Query(None, pattern="^branch$", description="branch para una serie por sede"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    try:
+        series = await session.run_sync(
+            compute_dashboard_series,
+            bucket=bucket,
+            from_date=from_date,
+            to_date=to_date,
+            branch_id=branch_id,
+            group_by_branch=group_by == "branch",
+        )
+        return {"bucket": bucket, "group_by": group_by, "series": series}
+    except Exception as e:
+        print(f"Error en dashboard_series: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error en series del dashboard: {str(e)}")
 
 
 @app.get("/dashboard")
-def dashboard(
+async def dashboard(
     from_date: Optional[date] = Query(None),
     to_date: Optional[date] = Query(None),
     branch_id: Optional[int] = Query(None),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     try:
-        vehicles_query = select(Vehicle)
-        if branch_id:
-            vehicles_query = vehicles_query.where(Vehicle.branch_id == branch_id)
-        vehicles = session.exec(vehicles_query).all()
-        vehicle_ids = [v.id for v in vehicles if v.id is not None]
-
-        income = 0.0
-        if vehicle_ids:
-            sale_query = select(Sale).where(Sale.vehicle_id.in_(vehicle_ids))
-            if from_date:
-                sale_query = sale_query.where(Sale.sale_date >= from_date)
-            if to_date:
-                sale_query = sale_query.where(Sale.sale_date <= to_date)
-            income = sum(s.sale_price for s in session.exec(sale_query).all())
-
-        expense_total = 0.0
-        if vehicle_ids:
-            expense_query = select(Expense).where(Expense.vehicle_id.in_(vehicle_ids))
-            if from_date:
-                expense_query = expense_query.where(Expense.expense_date >= from_date)
-            if to_date:
-                expense_query = expense_query.where(Expense.expense_date <= to_date)
-            expense_total = sum(exp.amount for exp in session.exec(expense_query).all())
-
-        margin = income - expense_total
-        return {
-            "vehicles": len(vehicles),
-            "income": income,
-            "expenses": expense_total,
-            "margin": margin,
-        }
+        # compute_dashboard es sincrono; run_sync lo ejecuta sobre la conexion asincrona sin ocupar el threadpool
+        return await session.run_sync(compute_dashboard, from_date=from_date, to_date=to_date, branch_id=branch_id)
     except Exception as e:
         print(f"Error en dashboard: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error en dashboard: {str(e)}")
 
 
+MARGIN_SORTS = ("margin", "days_in_stock", "purchase_date", "sale_date")
+
+
+@app.get("/reports/vehicle-margins", response_model=List[VehicleMarginRow])
+async def vehicle_margins_report(
+    branch_id: Optional[int] = Query(None),
+    state: Optional[str] = Query(None),
+    from_date: Optional[date] = Query(None, description="filter by purchase date >="),
+    to_date: Optional[date] = Query(None, description="filter by purchase date <="),
+    sold_from: Optional[date] = Query(None, description="filter by sale date >="),
+    sold_to: Optional[date] = Query(None, description="filter by sale date <="),
+    sort: str = Query("-margin", pattern=f"^-?({'|'.join(MARGIN_SORTS)})$", description="campo de orden; prefijo - para descendente"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Rentabilidad por vehiculo: compra, gastos, venta, margen y dias en stock en una sola consulta.
+
+    El margen solo se calcula para vehiculos vendidos; los no vendidos van al final al ordenar.
+    """
+    expenses = (
+        select(Expense.vehicle_id, func.sum(Expense.amount).label("expenses_total"))
+        .group_by(Expense.vehicle_id)
+        .subquery()
+    )
+    purchase_price = func.coalesce(Vehicle.purchase_price, 0.0)
+    expenses_total = func.coalesce(expenses.c.expenses_total, 0.0)
+    total_cost = purchase_price + expenses_total
+    sale_price = func.coalesce(Sale.sale_price, Vehicle.sale_price)
+    sale_date = func.coalesce(Sale.sale_date, Vehicle.sale_date)
+    margin = sale_price - total_cost
+    days_in_stock = days_between(func.coalesce(sale_date, func.current_date()), Vehicle.purchase_date)
+    columns = {
+        "margin": margin,
+        "days_in_stock": days_in_stock,
+        "purchase_date": Vehicle.purchase_date,
+        "sale_date": sale_date,
+    }
+
+    query = (
+        select(
+            Vehicle.id.label("vehicle_id"),
+            Vehicle.license_plate,
+            Vehicle.brand,
+            Vehicle.model,
+            Vehicle.branch_id,
+            Vehicle.status,
+            Vehicle.purchase_date,
+            sale_date.label("sale_date"),
+            purchase_price.label("purchase_price"),
+            expenses_total.label("expenses_total"),
+            total_cost.label("total_cost"),
+            sale_price.label("sale_price"),
+            margin.label("margin"),
+            days_in_stock.label("days_in_stock"),
+        )
+        .select_from(Vehicle)
+        .outerjoin(expenses, expenses.c.vehicle_id == Vehicle.id)
+        .outerjoin(Sale, Sale.vehicle_id == Vehicle.id)
+    )
+    if branch_id:
+        query = query.where(Vehicle.branch_id == branch_id)
+    if state:
+        query = query.where(Vehicle.status == state)
+    if from_date:
+        query = query.where(Vehicle.purchase_date >= from_date)
+    if to_date:
+        query = query.where(Vehicle.purchase_date <= to_date)
+    if sold_from:
+        query = query.where(sale_date >= sold_from)
+    if sold_to:
+        query = query.where(sale_date <= sold_to)
+
+    sort_column = columns[sort.lstrip("-")]
+    direction = sort_column.desc() if sort.startswith("-") else sort_column.asc()
+    query = query.order_by(sort_column.is_(None), direction, Vehicle.id).offset(offset).limit(limit)
+    try:
+        return FastJSONResponse(result_as_dicts(await session.execute(query)))
+    except Exception as e:
+        print(f"Error en vehicle_margins_report: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error en el informe de margenes: {str(e)}")
+
+
 @app.get("/export/vehicles")
-def export_vehicles(session: Session = Depends(get_session)):
-    vehicles = session.exec(select(Vehicle).order_by(Vehicle.id)).all()
-    headers = [
-        "id",
-        "vin",
-        "license_plate",
-        "brand",
-        "model",
-        "version",
-        "year",
-        "km",
-        "color",
-        "branch_id",
-        "status",
-        "purchase_price",
-        "purchase_date",
-        "sale_price",
-        "sale_date",
+def export_vehicles(
+    state: Optional[str] = None,
+    branch_id: Optional[int] = None,
+    from_date: Optional[date] = Query(None, description="filter by purchase date >="),
+    to_date: Optional[date] = Query(None, description="filter by purchase date <="),
+    gzip: bool = Query(False, description="comprimir la descarga (.csv.gz)"),
+):
+    columns = [
+        Vehicle.id,
+        Vehicle.vin,
+        Vehicle.license_plate,
+        Vehicle.brand,
+        Vehicle.model,
+        Vehicle.version,
+        Vehicle.year,
+        Vehicle.km,
+        Vehicle.color,
+        Vehicle.branch_id,
+        Vehicle.status,
+        Vehicle.purchase_price,
+        Vehicle.purchase_date,
+        Vehicle.sale_price,
+        Vehicle.sale_date,
     ]
-    lines = [",".join(headers)]
-    for v in vehicles:
-        values = [
-            str(v.id or ""),
-            v.vin or "",
-            v.license_plate or "",
-            v.brand or "",
-            v.model or "",
-            v.version or "",
-            str(v.year or ""),
-            str(v.km or ""),
-            v.color or "",
-            str(v.branch_id or ""),
-            v.status or "",
-            str(v.purchase_price or ""),
-            v.purchase_date.isoformat() if v.purchase_date else "",
-            str(v.sale_price or ""),
-            v.sale_date.isoformat() if v.sale_date else "",
-        ]
-        lines.append(",".join(value.replace(",", " ") for value in values))
-    return StreamingResponse(iter(["\n".join(lines)]), media_type="text/csv")
+    query = select(*columns)
+    if state:
+        query = query.where(Vehicle.status == state)
+    if branch_id:
+        query = query.where(Vehicle.branch_id == branch_id)
+    if from_date:
+        query = query.where(Vehicle.purchase_date >= from_date)
+    if to_date:
+        query = query.where(Vehicle.purchase_date <= to_date)
+    query = query.order_by(Vehicle.id)
+    headers = [column.key for column in columns]
+    return stream_csv(lambda: Session(engine), query, headers, "vehiculos", gzip=gzip)
 
 
 @app.get("/export/expenses")
-def export_expenses(session: Session = Depends(get_session)):
-    expenses = session.exec(select(Expense).order_by(Expense.expense_date)).all()
-    headers = ["id", "vehicle_id", "concept", "amount", "expense_date", "notes"]
-    lines = [",".join(headers)]
-    for exp in expenses:
-        values = [
-            str(exp.id or ""),
-            str(exp.vehicle_id),
-            exp.concept,
-            str(exp.amount),
-            exp.expense_date.isoformat(),
-            (exp.notes or "").replace(",", " "),
-        ]
-        lines.append(",".join(values))
-    return StreamingResponse(iter(["\n".join(lines)]), media_type="text/csv")
+def export_expenses(
+    vehicle_id: Optional[int] = None,
+    branch_id: Optional[int] = None,
+    from_date: Optional[date] = Query(None, description="filter by expense date >="),
+    to_date: Optional[date] = Query(None, description="filter by expense date <="),
+    gzip: bool = Query(False, description="comprimir la descarga (.csv.gz)"),
+):
+    columns = [Expense.id, Expense.vehicle_id, Expense.concept, Expense.amount, Expense.expense_date, Expense.notes]
+    query = select(*columns)
+    if vehicle_id:
+        query = query.where(Expense.vehicle_id == vehicle_id)
+    if branch_id:
+        query = query.join(Vehicle, Vehicle.id == Expense.vehicle_id).where(Vehicle.branch_id == branch_id)
+    if from_date:
+        query = query.where(Expense.expense_date >= from_date)
+    if to_date:
+        query = query.where(Expense.expense_date <= to_date)
+    query = query.order_by(Expense.expense_date, Expense.id)
+    headers = [column.key for column in columns]
+    return stream_csv(lambda: Session(engine), query, headers, "gastos", gzip=gzip)
 
 
 @app.get("/export/sales")
-def export_sales(session: Session = Depends(get_session)):
-    sales = session.exec(select(Sale).order_by(Sale.sale_date)).all()
-    headers = ["id", "vehicle_id", "sale_price", "sale_date", "client_name", "client_tax_id", "notes"]
-    lines = [",".join(headers)]
-    for sale in sales:
-        values = [
-            str(sale.id or ""),
-            str(sale.vehicle_id),
-            str(sale.sale_price),
-            sale.sale_date.isoformat(),
-            (sale.client_name or "").replace(",", " "),
-            sale.client_tax_id or "",
-            (sale.notes or "").replace(",", " "),
-        ]
-        lines.append(",".join(values))
-    return StreamingResponse(iter(["\n".join(lines)]), media_type="text/csv")
+def export_sales(
+    branch_id: Optional[int] = None,
+    from_date: Optional[date] = Query(None, description="filter by sale date >="),
+    to_date: Optional[date] = Query(None, description="filter by sale date <="),
+    gzip: bool = Query(False, description="comprimir la descarga (.csv.gz)"),
+):
+    columns = [Sale.id, Sale.vehicle_id, Sale.sale_price, Sale.sale_date, Sale.client_name, Sale.client_tax_id, Sale.notes]
+    query = select(*columns)
+    if branch_id:
+        query = query.join(Vehicle, Vehicle.id == Sale.vehicle_id).where(Vehicle.branch_id == branch_id)
+    if from_date:
+        query = query.where(Sale.sale_date >= from_date)
+    if to_date:
+        query = query.where(Sale.sale_date <= to_date)
+    query = query.order_by(Sale.sale_date, Sale.id)
+    headers = [column.key for column in columns]
+    return stream_csv(lambda: Session(engine), query, headers, "ventas", gzip=gzip)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(request_metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/debug/slow-queries")
+def slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    order: str = Query("total_ms", pattern="^(total_ms|max_ms|count)$"),
+):
+    if slow_query_log is None:
+        return {"enabled": False, "threshold_ms": None, "queries": []}
+    return {"enabled": True, "threshold_ms": slow_query_log.threshold_ms, "queries": slow_query_log.top(limit, order)}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return response_cache.stats()
 
 
 @app.get("/")
-def root():
+def root(request: Request):
+    if frontend_files.available:
+        return frontend_files.response(request, "")
     return {
         "message": "Sahocars API operativa",
         "docs": "/docs",
         "health": "/health",
     }
+
+
+# Build del frontend (modo produccion del launcher). Tiene que ser la ultima ruta:
+# solo recibe lo que no ha coincidido con ningun endpoint de la API.
+@app.get("/{asset_path:path}", include_in_schema=False)
+def frontend_asset(asset_path: str, request: Request):
+    if not frontend_files.available:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return frontend_files.response(request, asset_path)
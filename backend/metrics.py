@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class _RequestSQL:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Contador SQL de la peticion en curso. Es un objeto mutable para que los hilos del
+# threadpool y los greenlets de AsyncSession, que reciben una copia del contexto,
+# sumen sobre el mismo contador.
+_current_sql: ContextVar[Optional[_RequestSQL]] = ContextVar("request_sql", default=None)
+# Plantilla de la ruta en curso, para quien necesite atribuir trabajo a un endpoint
+current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """Metricas por ruta en memoria del proceso, exportadas en formato de texto de Prometheus.
+
+    Las etiquetas usan la plantilla de la ruta (/vehicles/{vehicle_id}) y no la ruta real,
+    para que el numero de series no crezca con los ids.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], _Histogram] = {}
+        self.in_flight: Dict[Tuple[str, str], int] = {}
+        self.sql_statements: Dict[Tuple[str, str], _Histogram] = {}
+        self.sql_seconds: Dict[Tuple[str, str], float] = {}
+
+    def start(self, method: str, route: str):
+        with self._lock:
+            key = (method, route)
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def finish(self, method: str, route: str, status: int, seconds: float, sql: _RequestSQL):
+        with self._lock:
+            key = (method, route)
+            self.in_flight[key] -= 1
+            self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+            self.latency.setdefault(key, _Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.sql_statements.setdefault(key, _Histogram(QUERY_COUNT_BUCKETS)).observe(sql.count)
+            self.sql_seconds[key] = self.sql_seconds.get(key, 0.0) + sql.seconds
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            lines += [
+                "# HELP http_requests_total Peticiones HTTP atendidas.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), value in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {value}")
+
+            lines += [
+                "# HELP http_requests_in_progress Peticiones HTTP en curso.",
+                "# TYPE http_requests_in_progress gauge",
+            ]
+            for (method, route), value in sorted(self.in_flight.items()):
+                lines.append(f"http_requests_in_progress{_labels(method=method, route=route)} {value}")
+
+            lines += _render_histograms(
+                "http_request_duration_seconds", "Latencia de las peticiones HTTP en segundos.", self.latency
+            )
+            lines += _render_histograms(
+                "db_statements_per_request", "Sentencias SQL ejecutadas por peticion.", self.sql_statements
+            )
+
+            lines += [
+                "# HELP db_statement_duration_seconds_total Tiempo total en sentencias SQL.",
+                "# TYPE db_statement_duration_seconds_total counter",
+            ]
+            for (method, route), value in sorted(self.sql_seconds.items()):
+                lines.append(f"db_statement_duration_seconds_total{_labels(method=method, route=route)} {value:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _render_histograms(name: str, help_text: str, histograms: Dict[Tuple[str, str], _Histogram]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (method, route), histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(method=method, route=route)} {histogram.total:.6f}")
+        lines.append(f"{name}_count{_labels(method=method, route=route)} {histogram.count}")
+    return lines
+
+
+def install_sql_hooks(engine: Engine):
+    """Cuenta sentencias y tiempo SQL de la peticion en curso. Para el engine asincrono, pasar `.sync_engine`."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        # Una conexion ejecuta una sentencia cada vez: basta con un instante por conexion
+        conn.info["metrics_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        current = _current_sql.get()
+        if current is not None:
+            current.count += 1
+            current.seconds += time.perf_counter() - conn.info["metrics_started"]
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide cada peticion HTTP hasta el ultimo trozo del cuerpo.
+
+    Asi las descargas en streaming cuentan todo su tiempo y todas sus consultas.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics, routes: Sequence):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes
+
+        @lru_cache(maxsize=2048)
+        def route_for(method: str, path: str) -> str:
+            scope = {"type": "http", "method": method, "path": path}
+            partial = UNMATCHED_ROUTE
+            for route in self.routes:
+                match, _ = route.matches(scope)
+                if match == Match.FULL:
+                    return route.path
+                if match == Match.PARTIAL and partial == UNMATCHED_ROUTE:
+                    # misma ruta con otro metodo: la respuesta sera un 405
+                    partial = route.path
+            return partial
+
+        self._route_for = route_for
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route_for(method, scope["path"])
+        sql = _RequestSQL()
+        token = _current_sql.set(sql)
+        route_token = current_route.set(f"{method} {route}")
+        status = 500
+        started = time.perf_counter()
+        self.metrics.start(method, route)
+
+        async def capture(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            _current_sql.reset(token)
+            current_route.reset(route_token)
+            self.metrics.finish(method, route, status, time.perf_counter() - started, sql)
@@ -0,0 +1,116 @@
+"""Migraciones de esquema numeradas con sello de version en la tabla `schema_version`.
+
+Cada arranque lee la version aplicada (una consulta) y, si coincide con la ultima
+migracion registrada, no toca el esquema. Si hay pendientes, las aplica una sola vez
+bajo un bloqueo de escritura para que varios workers arrancando a la vez no compitan.
+Las migraciones deben ser idempotentes: las bases anteriores a esta tabla empiezan en
+la version 0 aunque ya tengan parte del esquema.
+"""
+from __future__ import annotations
+
+import time
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, func, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+MIGRATION_LOCK_TIMEOUT = 120
+# Clave arbitraria del advisory lock de Postgres
+PG_LOCK_KEY = 727_001
+
+schema_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    schema_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+    Column("duration_ms", Float, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+class MigrationRegistry:
+    def __init__(self):
+        self.migrations: List[Migration] = []
+
+    def register(self, version: int, description: str):
+        """Decorador: registra `fn(connection)` como la migracion `version`."""
+
+        def decorator(fn: Callable[[Connection], None]):
+            if any(migration.version == version for migration in self.migrations):
+                raise ValueError(f"Migracion {version} duplicada")
+            self.migrations.append(Migration(version, description, fn))
+            self.migrations.sort(key=lambda migration: migration.version)
+            return fn
+
+        return decorator
+
+    @property
+    def head(self) -> int:
+        return self.migrations[-1].version if self.migrations else 0
+
+
+def current_version(connection: Connection) -> int:
+    """Version aplicada; 0 si la tabla de versiones aun no existe."""
+    try:
+        return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except DBAPIError:
+        connection.rollback()
+        return 0
+
+
+def _lock(connection: Connection) -> None:
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SELECT pg_advisory_xact_lock({PG_LOCK_KEY})")
+        return
+    if connection.dialect.name != "sqlite":
+        return
+    # BEGIN IMMEDIATE toma el bloqueo de escritura ya; los demas workers esperan aqui
+    # (busy_timeout) y reintentan hasta MIGRATION_LOCK_TIMEOUT.
+    deadline = time.monotonic() + MIGRATION_LOCK_TIMEOUT
+    while True:
+        try:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            return
+        except OperationalError as e:
+            if "locked" not in str(e) or time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def migrate(engine: Engine, registry: MigrationRegistry) -> List[Migration]:
+    """Aplica las migraciones pendientes y devuelve las aplicadas (vacia si el sello ya coincide)."""
+    with engine.connect() as connection:
+        if current_version(connection) >= registry.head:
+            return []
+
+    applied: List[Migration] = []
+    with engine.connect() as connection:
+        _lock(connection)
+        schema_metadata.create_all(connection)
+        # Otro worker puede haberlas aplicado mientras esperabamos el bloqueo
+        version = current_version(connection)
+        for migration in registry.migrations:
+            if migration.version <= version:
+                continue
+            started = time.perf_counter()
+            migration.apply(connection)
+            connection.execute(
+                schema_version.insert().values(
+                    version=migration.version,
+                    description=migration.description,
+                    applied_at=datetime.utcnow(),
+                    duration_ms=round((time.perf_counter() - started) * 1000, 2),
+                )
+            )
+            applied.append(migration)
+        connection.commit()
+    return applied
@@ -4,6 +4,7 @@ from datetime import date, datetime
 from enum import Enum
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
 
@@ -17,6 +18,12 @@ class VehicleStatus(str, Enum):
 
 class Vehicle(SQLModel, table=True):
     __tablename__ = "vehicle"
+    __table_args__ = (
+        Index("ix_vehicle_status_branch_created", "status", "branch_id", "created_at"),
+        Index("ix_vehicle_branch_purchase_date", "branch_id", "purchase_date"),
+        # Orden del listado por cursor sin filtros
+        Index("ix_vehicle_created_id", "created_at", "id"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     vin: str = Field(index=True)
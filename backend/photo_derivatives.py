@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # sin Pillow se sirve siempre el original
+    Image = None
+
+# Lado mayor en pixeles de cada variante; "original" es el fichero subido tal cual
+DERIVATIVE_SIZES = {
+    "thumb": 320,
+    "medium": 1280,
+}
+JPEG_QUALITY = int(os.getenv("PHOTO_JPEG_QUALITY", "82"))
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", "2"))
+
+# Se crea con la primera subida y se descarta al parar la app, para que un segundo
+# arranque en el mismo proceso (tests, --reload) no encuentre un pool ya cerrado
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def derivative_path(original: Path, size: str) -> Path:
+    return original.with_name(f"{original.name}.{size}.jpg")
+
+
+def _generate(original: Path, size: str) -> Path:
+    destination = derivative_path(original, size)
+    max_side = DERIVATIVE_SIZES[size]
+    with Image.open(original) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        fd, tmp_name = tempfile.mkstemp(dir=destination.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                image.save(tmp, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            os.replace(tmp_name, destination)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+    return destination
+
+
+def ensure_derivative(original: Path, size: str) -> Optional[Path]:
+    """Ruta de la variante `size`, generandola si aun no existe. None si no se puede generar."""
+    if Image is None or size not in DERIVATIVE_SIZES:
+        return None
+    destination = derivative_path(original, size)
+    if destination.exists():
+        return destination
+    try:
+        return _generate(original, size)
+    except Exception as e:
+        print(f"Error generando la variante {size} de {original}: {str(e)}")
+        return None
+
+
+def schedule_derivatives(original: Path) -> None:
+    """Encola la generacion de todas las variantes fuera del ciclo de la peticion."""
+    global _executor
+    if Image is None:
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PHOTO_WORKERS, thread_name_prefix="photo-derivatives")
+        for size in DERIVATIVE_SIZES:
+            _executor.submit(ensure_derivative, original, size)
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
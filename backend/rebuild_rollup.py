@@ -0,0 +1,20 @@
+"""Rellena de nuevo la tabla de rollup del dashboard desde ventas, gastos y vehiculos.
+
+Uso: python rebuild_rollup.py
+"""
+from __future__ import annotations
+
+from sqlmodel import Session
+
+from main import engine, init_db, rebuild_dashboard_rollup
+
+
+def main():
+    init_db()
+    with Session(engine) as session:
+        rows = rebuild_dashboard_rollup(session)
+    print(f"Rollup del dashboard reconstruido: {rows} filas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Column, Integer, MetaData, String, Table, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "15"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", str(1024 * 1024)))
+
+_MISS = object()
+
+cache_metadata = MetaData()
+cache_generation = Table(
+    "cache_generation",
+    cache_metadata,
+    Column("name", String, primary_key=True),
+    Column("generation", Integer, nullable=False),
+)
+
+
+class SharedGenerations:
+    """Contadores de generacion en la tabla `cache_generation`, comunes a todos los workers.
+
+    Una escritura en un worker sube el contador en la base de datos y las entradas que
+    los demas workers tengan de esa tabla dejan de valer en su siguiente peticion.
+    La lectura va por la conexion DBAPI sin pasar por SQLAlchemy (unos 20 us en SQLite
+    frente a 350 us), porque se hace en cada GET cacheable.
+
+    Con un fichero SQLite se lee en el propio bucle por una conexion dedicada, fuera del
+    pool de la app: con el pool agotado la espera de una conexion bloquearia el bucle.
+    En otro caso se lee en el threadpool.
+    """
+
+    READ_SQL = "SELECT name, generation FROM cache_generation"
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        database = engine.url.database if engine.dialect.name == "sqlite" else None
+        self.local = bool(database) and ":memory:" not in database
+        self._connection = None
+        self._connection_lock = threading.Lock()
+
+    def all(self) -> Dict[str, int]:
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(self.READ_SQL)
+            rows = dict(cursor.fetchall())
+            cursor.close()
+            return rows
+        finally:
+            connection.close()
+
+    def _read_local(self) -> Dict[str, int]:
+        with self._connection_lock:
+            if self._connection is None:
+                args, kwargs = self.engine.dialect.create_connect_args(self.engine.url)
+                # Sin espera: si la base esta bloqueada falla al momento y se salta la cache
+                kwargs.update(timeout=0, check_same_thread=False)
+                self._connection = self.engine.dialect.loaded_dbapi.connect(*args, **kwargs)
+            try:
+                return dict(self._connection.execute(self.READ_SQL).fetchall())
+            except Exception:
+                self._close_local()
+                raise
+
+    def _close_local(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def close(self) -> None:
+        with self._connection_lock:
+            self._close_local()
+
+    def read(self, tables: Sequence[str]) -> Optional[tuple]:
+        """Generacion actual de cada tabla; None si no se puede leer (se salta la cache)."""
+        try:
+            rows = self._read_local() if self.local else self.all()
+        except Exception as e:
+            print(f"Error en SharedGenerations.read: {str(e)}")
+            return None
+        return tuple(rows.get(table, 0) for table in tables)
+
+    def bump(self, tables: Iterable[str]) -> None:
+        with self.engine.begin() as connection:
+            for table in tables:
+                updated = connection.execute(
+                    update(cache_generation)
+                    .where(cache_generation.c.name == table)
+                    .values(generation=cache_generation.c.generation + 1)
+                ).rowcount
+                if not updated:
+                    connection.execute(insert(cache_generation).values(name=table, generation=1))
+
+
+def seed_generations(connection, tables: Iterable[str]) -> None:
+    """Crea la tabla y una fila por tabla cacheada, para que `bump` solo haga UPDATE."""
+    cache_generation.create(connection, checkfirst=True)
+    existing = set(connection.execute(select(cache_generation.c.name)).scalars())
+    rows = [{"name": table, "generation": 0} for table in sorted(set(tables) - existing)]
+    if rows:
+        connection.execute(insert(cache_generation), rows)
+
+
+class ResponseCache:
+    """LRU con TTL invalidado por contadores de generacion por tabla.
+
+    Cada entrada guarda la generacion de las tablas de las que depende en el momento
+    de calcularse; cuando un endpoint de escritura llama a `invalidate(tabla)` la
+    generacion sube y todas esas entradas dejan de ser validas sin tener que buscarlas.
+    Con `shared` los contadores viven en la base de datos y valen para todos los
+    workers; sin el son del proceso.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = RESPONSE_CACHE_TTL,
+        shared: Optional[SharedGenerations] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def snapshot(self, tables: Sequence[str]) -> Optional[tuple]:
+        """Generaciones actuales de `tables` (una consulta si son compartidas)."""
+        if self.shared is not None:
+            return self.shared.read(tables)
+        with self._lock:
+            return tuple(self._generations.get(table, 0) for table in tables)
+
+    def invalidate(self, *tables: str) -> None:
+        """Se llama tras confirmar la escritura, desde endpoints sincronos (threadpool)."""
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            self.invalidations += 1
+        if self.shared is not None and self.enabled:
+            try:
+                self.shared.bump(tables)
+            except DBAPIError as e:
+                # Los demas workers veran el cambio como tarde al caducar el TTL
+                print(f"Error en ResponseCache.invalidate: {str(e)}")
+                self.clear()
+
+    def get(self, key: tuple, current: tuple):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, generations, value = entry
+                if expires_at > now and generations == current:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return _MISS
+
+    def set(self, key: tuple, generations: tuple, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, generations, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        generations = None
+        if self.shared is not None:
+            try:
+                generations = self.shared.all()
+            except Exception as e:
+                print(f"Error en ResponseCache.stats: {str(e)}")
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "shared_generations": self.shared is not None,
+                # Si no se pudieron leer las compartidas se muestran las del proceso
+                "generations": generations if generations is not None else dict(self._generations),
+            }
+
+
+class ResponseCacheMiddleware:
+    """Middleware ASGI que cachea respuestas GET 200 de las rutas configuradas.
+
+    `rules` es una lista de (patron de ruta, tablas de las que depende). La clave es la
+    ruta mas los parametros de consulta ordenados. Debe ir por dentro de CORS para no
+    guardar cabeceras que dependen del Origin de cada peticion.
+    """
+
+    def __init__(self, app, cache: ResponseCache, rules: Sequence[Tuple[str, Sequence[str]]], max_body: int = RESPONSE_CACHE_MAX_BODY):
+        self.app = app
+        self.cache = cache
+        self.rules = [(re.compile(f"^{pattern}$"), tuple(tables)) for pattern, tables in rules]
+        self.max_body = max_body
+
+    def _tables_for(self, path: str) -> Optional[tuple]:
+        for pattern, tables in self.rules:
+            if pattern.match(path):
+                return tables
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not self.cache.enabled:
+            await self.app(scope, receive, send)
+            return
+        tables = self._tables_for(scope["path"])
+        if tables is None:
+            await self.app(scope, receive, send)
+            return
+
+        # La generacion se toma antes de ejecutar el endpoint: si una escritura llega
+        # mientras tanto, la entrada guardada ya nace invalida.
+        if self.cache.shared is not None and not self.cache.shared.local:
+            generations = await run_in_threadpool(self.cache.snapshot, tables)
+        else:
+            generations = self.cache.snapshot(tables)
+        if generations is None:
+            await self.app(scope, receive, send)
+            return
+
+        query = tuple(sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)))
+        key = (scope["path"], query)
+        cached = self.cache.get(key, generations)
+        if cached is not _MISS:
+            status, headers, body = cached
+            await send({"type": "http.response.start", "status": status, "headers": headers + [(b"x-cache", b"HIT")]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        start_message = {}
+        chunks: List[bytes] = []
+        size = 0
+        cacheable = True
+
+        async def capture(message):
+            nonlocal size, cacheable
+            if message["type"] == "http.response.start":
+                start_message.update(message)
+                cacheable = message["status"] == 200
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-cache", b"MISS")]}
+            elif message["type"] == "http.response.body" and cacheable:
+                size += len(message.get("body", b""))
+                if size > self.max_body:
+                    cacheable = False
+                    chunks.clear()
+                else:
+                    chunks.append(message.get("body", b""))
+                if not message.get("more_body", False) and cacheable:
+                    headers = [(name, value) for name, value in start_message.get("headers", [])]
+                    self.cache.set(key, generations, (start_message["status"], headers, b"".join(chunks)))
+            await send(message)
+
+        await self.app(scope, receive, capture)
@@ -3,11 +3,14 @@ from __future__ import annotations
 from datetime import date, datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import tuple_
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from db import get_session
+from db import get_async_session, get_session
 from models.vehicle import Vehicle, VehicleStatus
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 from schemas.vehicle import VehicleCreate, VehicleRead, VehicleUpdate
 
 router = APIRouter(prefix="/vehicles", tags=["vehicles"])
@@ -23,12 +26,15 @@ def create_vehicle(vehicle_data: VehicleCreate, session: Session = Depends(get_s
 
 
 @router.get("", response_model=List[VehicleRead])
-def list_vehicles(
+async def list_vehicles(
+    response: Response,
     status: Optional[VehicleStatus] = Query(None),
     branch_id: Optional[int] = Query(None),
     from_date: Optional[date] = Query(None, description="filter by purchase date >="),
     to_date: Optional[date] = Query(None, description="filter by purchase date <="),
-    session: Session = Depends(get_session),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_async_session),
 ):
     query = select(Vehicle)
     if status:
@@ -39,13 +45,22 @@ def list_vehicles(
         query = query.where(Vehicle.purchase_date >= from_date)
     if to_date:
         query = query.where(Vehicle.purchase_date <= to_date)
-    query = query.order_by(Vehicle.created_at.desc())
-    return session.exec(query).all()
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.where(tuple_(Vehicle.created_at, Vehicle.id) < (cursor_created_at, cursor_id))
+    query = query.order_by(Vehicle.created_at.desc(), Vehicle.id.desc())
+    if limit is None:
+        return (await session.exec(query)).all()
+    vehicles = (await session.exec(query.limit(limit + 1))).all()
+    if len(vehicles) > limit:
+        vehicles = vehicles[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(vehicles[-1].created_at, vehicles[-1].id)
+    return vehicles
 
 
 @router.get("/{vehicle_id}", response_model=VehicleRead)
-def get_vehicle(vehicle_id: int, session: Session = Depends(get_session)):
-    vehicle = session.get(Vehicle, vehicle_id)
+async def get_vehicle(vehicle_id: int, session: AsyncSession = Depends(get_async_session)):
+    vehicle = await session.get(Vehicle, vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehiculo no encontrado")
     return vehicle
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Indice FTS5 de vehiculos. Matricula y VIN se guardan normalizados (mayusculas, sin
+# espacios ni guiones) para que "1234 K" encuentre "1234-KLM". El tokenizador trigram
+# permite buscar cualquier fragmento de 3 o mas caracteres.
+FTS_TABLE = "vehicle_fts"
+FTS_COLUMNS = ("plate", "vin", "brand", "model", "version", "notes")
+# Pesos de bm25 por columna, en el orden de FTS_COLUMNS
+FTS_WEIGHTS = (10.0, 8.0, 3.0, 3.0, 1.0, 1.0)
+
+
+def _normalized(expression: str) -> str:
+    return f"upper(replace(replace(coalesce({expression}, ''), ' ', ''), '-', ''))"
+
+
+def _values(prefix: str) -> str:
+    return ", ".join(
+        [
+            f"{prefix}.id",
+            _normalized(f"{prefix}.license_plate"),
+            _normalized(f"{prefix}.vin"),
+            f"coalesce({prefix}.brand, '')",
+            f"coalesce({prefix}.model, '')",
+            f"coalesce({prefix}.version, '')",
+            f"coalesce({prefix}.notes, '')",
+        ]
+    )
+
+
+_COLUMN_LIST = ", ".join(("rowid",) + FTS_COLUMNS)
+
+FTS_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({', '.join(FTS_COLUMNS)}, tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS vehicle_fts_insert AFTER INSERT ON vehicle BEGIN
+        INSERT INTO {FTS_TABLE}({_COLUMN_LIST}) VALUES ({_values('new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS vehicle_fts_update AFTER UPDATE ON vehicle BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}({_COLUMN_LIST}) VALUES ({_values('new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS vehicle_fts_delete AFTER DELETE ON vehicle BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+)
+
+
+def install_vehicle_fts(connection: Connection) -> bool:
+    """Crea el indice, sus triggers y lo rellena si esta vacio. False si SQLite no tiene FTS5/trigram."""
+    if connection.dialect.name != "sqlite":
+        return False
+    try:
+        for statement in FTS_DDL:
+            connection.execute(text(statement))
+    except Exception as e:
+        print(f"Busqueda FTS5 no disponible, se usara LIKE: {str(e)}")
+        return False
+    indexed = connection.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+    if not indexed:
+        select_values = _values("vehicle")
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({_COLUMN_LIST}) SELECT {select_values} FROM vehicle"))
+    return True
+
+
+def vehicle_fts_installed(connection: Connection) -> bool:
+    if connection.dialect.name != "sqlite":
+        return False
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).first() is not None
+
+
+def _phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def build_match_query(q: str) -> Optional[str]:
+    """Expresion MATCH: la frase en cualquier columna, o el fragmento normalizado en matricula/VIN."""
+    terms = []
+    phrase = q.strip()
+    if len(phrase) >= 3:
+        terms.append(_phrase(phrase))
+    compact = phrase.upper().replace(" ", "").replace("-", "")
+    if len(compact) >= 3:
+        terms.append("{plate vin} : " + _phrase(compact))
+    return " OR ".join(terms) or None
+
+
+def ranked_search_sql() -> str:
+    weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+    return (
+        f"SELECT vehicle.* FROM {FTS_TABLE} JOIN vehicle ON vehicle.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH :match "
+        f"ORDER BY bm25({FTS_TABLE}, {weights}), vehicle.id DESC "
+        "LIMIT :limit OFFSET :offset"
+    )
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import current_route
+
+# Umbral en milisegundos; 0 (por defecto) deja el registro desactivado
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "slow_queries.log")
+SLOW_QUERY_LOG_INTERVAL = float(os.getenv("SLOW_QUERY_LOG_INTERVAL", "60"))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "3"))
+MAX_TRACKED_STATEMENTS = 500
+MAX_PARAMS_LENGTH = 500
+
+
+class SlowQueryLog:
+    """Registro de sentencias que superan el umbral, agregado por texto SQL.
+
+    Las estadisticas se acumulan siempre; la escritura al fichero y el EXPLAIN se limitan
+    a una vez por sentencia cada `interval` segundos para no inundar el log ni
+    duplicar la carga cuando una consulta lenta se repite en bucle.
+    """
+
+    def __init__(self, threshold_ms: float, path: str, interval: float = SLOW_QUERY_LOG_INTERVAL):
+        self.threshold = threshold_ms / 1000
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stats: Dict[str, dict] = {}
+        self._last_logged: Dict[str, float] = {}
+        self.logger = logging.getLogger("sahocars.slow_queries")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=SLOW_QUERY_LOG_MAX_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(handler)
+
+    def install(self, engine: Engine):
+        """Engancha el registro a un engine. Para el engine asincrono, pasar `.sync_engine`."""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info["slow_query_started"] = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["slow_query_started"]
+            if elapsed >= self.threshold:
+                self.record(conn, statement, parameters, elapsed, executemany)
+
+    def record(self, conn, statement: str, parameters, elapsed: float, executemany: bool):
+        route = current_route.get()
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats.get(statement)
+            if stats is None:
+                if len(self._stats) >= MAX_TRACKED_STATEMENTS:
+                    # Se descarta la sentencia con menos tiempo acumulado
+                    del self._stats[min(self._stats, key=lambda key: self._stats[key]["total_ms"])]
+                stats = self._stats[statement] = {"statement": statement, "count": 0, "total_ms": 0.0, "max_ms": 0.0, "routes": {}}
+            elapsed_ms = elapsed * 1000
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            if route:
+                stats["routes"][route] = stats["routes"].get(route, 0) + 1
+            should_log = now - self._last_logged.get(statement, float("-inf")) >= self.interval
+            if should_log:
+                self._last_logged[statement] = now
+
+        if not should_log:
+            return
+        plan = None if executemany else self.explain(conn, statement, parameters)
+        with self._lock:
+            if plan is not None:
+                stats["plan"] = plan
+        self.logger.info(
+            json.dumps(
+                {
+                    "at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+                    "ms": round(elapsed_ms, 2),
+                    "route": route,
+                    "statement": statement,
+                    "params": repr(parameters)[:MAX_PARAMS_LENGTH],
+                    "plan": plan,
+                },
+                ensure_ascii=False,
+            )
+        )
+
+    def explain(self, conn, statement: str, parameters) -> Optional[List[str]]:
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return None
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+        # Cursor DBAPI directo: no pasa por los eventos del engine ni por este registro
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [" ".join(str(value) for value in row) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error en explain de consulta lenta: {str(e)}")
+            return None
+        finally:
+            cursor.close()
+
+    def top(self, limit: int = 20, order: str = "total_ms") -> List[dict]:
+        with self._lock:
+            entries = [dict(stats, routes=dict(stats["routes"])) for stats in self._stats.values()]
+        entries.sort(key=lambda entry: entry[order], reverse=True)
+        for entry in entries:
+            entry["avg_ms"] = round(entry["total_ms"] / entry["count"], 2)
+            entry["total_ms"] = round(entry["total_ms"], 2)
+            entry["max_ms"] = round(entry["max_ms"], 2)
+        return entries[:limit]
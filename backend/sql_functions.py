@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from sqlalchemy import Date, Integer
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class day_start(FunctionElement):
+    """Fecha (sin hora) de una columna de fecha u hora, portable entre SQLite y Postgres."""
+
+    type = Date()
+    name = "day_start"
+    inherit_cache = True
+
+
+class week_start(FunctionElement):
+    """Lunes de la semana ISO de una columna de fecha, portable entre SQLite y Postgres."""
+
+    type = Date()
+    name = "week_start"
+    inherit_cache = True
+
+
+class month_start(FunctionElement):
+    """Primer dia del mes de una columna de fecha, portable entre SQLite y Postgres."""
+
+    type = Date()
+    name = "month_start"
+    inherit_cache = True
+
+
+# Agrupaciones temporales disponibles para series (ver /dashboard/series)
+DATE_BUCKETS = {
+    "day": day_start,
+    "week": week_start,
+    "month": month_start,
+}
+
+
+@compiles(day_start)
+def _day_start_default(element, compiler, **kw):
+    return "CAST(%s AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_start, "sqlite")
+def _day_start_sqlite(element, compiler, **kw):
+    return "date(%s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(week_start)
+def _week_start_default(element, compiler, **kw):
+    # date_trunc('week') de Postgres ya empieza en lunes
+    return "CAST(date_trunc('week', %s) AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(week_start, "sqlite")
+def _week_start_sqlite(element, compiler, **kw):
+    # retrocede 6 dias y avanza al siguiente lunes: el lunes de la misma semana
+    return "date(%s, '-6 days', 'weekday 1')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_start)
+def _month_start_default(element, compiler, **kw):
+    return "CAST(date_trunc('month', %s) AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_start, "sqlite")
+def _month_start_sqlite(element, compiler, **kw):
+    return "date(%s, 'start of month')" % compiler.process(element.clauses, **kw)
+
+
+class days_between(FunctionElement):
+    """Dias enteros entre dos fechas (fin - inicio), portable entre SQLite y Postgres."""
+
+    type = Integer()
+    name = "days_between"
+    inherit_cache = True
+
+
+@compiles(days_between)
+def _days_between_default(element, compiler, **kw):
+    end, start = list(element.clauses)
+    return "(CAST(%s AS DATE) - CAST(%s AS DATE))" % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+
+@compiles(days_between, "sqlite")
+def _days_between_sqlite(element, compiler, **kw):
+    end, start = list(element.clauses)
+    return "CAST(julianday(%s) - julianday(%s) AS INTEGER)" % (compiler.process(end, **kw), compiler.process(start, **kw))
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# db.py y main.py leen la configuracion al importarse: base de datos y storage temporales
+_tmp = tempfile.mkdtemp(prefix="sahocars-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_tmp) / 'test.db'}"
+os.environ["STORAGE_ROOT"] = str(Path(_tmp) / "storage")
+os.environ["RESPONSE_CACHE_TTL"] = "0"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,52 @@
+import io
+import os
+import time
+from datetime import timedelta
+
+from sqlmodel import Session
+
+
+def _put(content: bytes, age_hours: float = 0):
+    from main import blob_store
+
+    sha256, _, path, _ = blob_store.put(io.BytesIO(content))
+    if age_hours:
+        old = time.time() - age_hours * 3600
+        os.utime(path, (old, old))
+    return sha256, path
+
+
+def test_sweep_removes_only_old_unreferenced_blobs(client):
+    from main import Blob, engine, sweep_orphan_blobs
+
+    orphan, orphan_path = _put(b"subida que fallo", age_hours=48)
+    thumb = orphan_path.with_name(f"{orphan}.thumb.jpg")
+    thumb.write_bytes(b"jpg")
+    # Sin fila todavia: puede ser una subida en curso
+    recent, recent_path = _put(b"subida en curso")
+    referenced, referenced_path = _put(b"documento confirmado", age_hours=48)
+    with Session(engine) as session:
+        session.add(Blob(sha256=referenced, size=20, ref_count=1))
+        session.commit()
+
+    with Session(engine) as session:
+        removed = sweep_orphan_blobs(session, timedelta(hours=24))
+
+    assert orphan in removed
+    assert not orphan_path.exists() and not thumb.exists()
+    assert recent_path.exists()
+    assert referenced_path.exists()
+
+
+def test_put_of_existing_blob_renews_grace_period(client):
+    from main import engine, sweep_orphan_blobs
+
+    sha256, path = _put(b"mismo contenido", age_hours=48)
+    # Otra subida del mismo contenido, aun sin confirmar su fila en Blob
+    _put(b"mismo contenido")
+
+    with Session(engine) as session:
+        removed = sweep_orphan_blobs(session, timedelta(hours=24))
+
+    assert sha256 not in removed
+    assert path.exists()
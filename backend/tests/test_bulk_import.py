@@ -0,0 +1,35 @@
+from sqlmodel import Session, func, select
+
+CSV_HEADER = "vin,license_plate,brand,model,year,km,branch_id,purchase_price,purchase_date\n"
+
+
+def _vehicle_count() -> int:
+    from main import Vehicle, engine
+
+    with Session(engine) as session:
+        return session.exec(select(func.count(Vehicle.id))).one()
+
+
+def test_bulk_import_rejects_non_utf8_before_importing(client):
+    before = _vehicle_count()
+    rows = "".join(f"VIN{i},{i:04d}ABC,Seat,Ibiza,2020,1000,1,5000,2024-01-01\n" for i in range(5))
+    # CSV exportado desde Excel en cp1252; la fila con "Citroën" llega despues del primer lote
+    body = (CSV_HEADER + rows).encode() + "VIN9,9999ABC,Citroën,C4,2020,1000,1,5000,2024-01-01\n".encode("cp1252")
+
+    response = client.post("/vehicles/bulk?batch_size=2", content=body, headers={"content-type": "text/csv"})
+
+    assert response.status_code == 400
+    assert "UTF-8" in response.json()["detail"]
+    assert "linea 7" in response.json()["detail"]
+    assert _vehicle_count() == before
+
+
+def test_bulk_import_accepts_utf8_with_bom(client):
+    before = _vehicle_count()
+    body = "﻿".encode() + (CSV_HEADER + "VINX,1234XYZ,Citroën,C4,2020,1000,1,5000,2024-01-01\n").encode()
+
+    response = client.post("/vehicles/bulk", content=body, headers={"content-type": "text/csv"})
+
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 1
+    assert _vehicle_count() == before + 1
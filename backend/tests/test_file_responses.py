@@ -0,0 +1,63 @@
+from datetime import date
+
+import pytest
+
+from file_responses import _etag_matches, _parse_range
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-9", (0, 9)),
+        ("bytes=90-", (90, 99)),
+        ("bytes=-10", (90, 99)),
+        ("bytes=95-500", (95, 99)),
+        ("Bytes = 0-0", (0, 0)),
+    ],
+)
+def test_parse_range_valid(header, expected):
+    assert _parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=abc", "bytes=", "bytes=-", "bytes=10-5", "bytes=0-1,5-6", "items=0-9", "0-9"])
+def test_parse_range_ignores_malformed_headers(header):
+    assert _parse_range(header, 100) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_parse_range_rejects_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        _parse_range(header, 100)
+
+
+def test_etag_matches_lists_and_weak_validators():
+    assert _etag_matches('"a", W/"b"', '"b"')
+    assert _etag_matches("*", '"b"')
+    assert not _etag_matches('"a"', '"b"')
+
+
+def test_download_ignores_malformed_range_and_revalidates_derivatives(client):
+    from main import Photo, Vehicle, engine
+    from sqlmodel import Session
+
+    with Session(engine) as session:
+        vehicle = Vehicle(
+            vin="VINRANGE", license_plate="0000RNG", brand="Seat", model="Leon", year=2020, km=1,
+            branch_id=1, purchase_price=1, purchase_date=date(2024, 1, 1),
+        )
+        session.add(vehicle)
+        session.commit()
+        vehicle_id = vehicle.id
+    response = client.post(f"/vehicles/{vehicle_id}/photos", files={"file": ("foto.jpg", b"0123456789", "image/jpeg")})
+    photo = response.json()
+
+    malformed = client.get(f"/photos/{photo['id']}", headers={"Range": "bytes=abc"})
+    assert malformed.status_code == 200
+    assert malformed.content == b"0123456789"
+    unsatisfiable = client.get(f"/photos/{photo['id']}", headers={"Range": "bytes=50-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == "bytes */10"
+
+    etag = f'"{photo["sha256"]}-thumb"'
+    revalidated = client.get(f"/photos/{photo['id']}?size=thumb", headers={"If-None-Match": f'"otro", W/{etag}'})
+    assert revalidated.status_code == 304
@@ -0,0 +1,33 @@
+import time
+
+from sqlalchemy import create_engine
+
+from response_cache import ResponseCache, SharedGenerations, seed_generations
+
+
+def test_sqlite_read_does_not_wait_for_the_app_pool(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}", pool_size=1, max_overflow=0, pool_timeout=5)
+    with engine.begin() as connection:
+        seed_generations(connection, ["vehicle"])
+    shared = SharedGenerations(engine)
+    try:
+        # Pool agotado: una lectura por raw_connection() esperaria pool_timeout
+        with engine.connect():
+            start = time.perf_counter()
+            assert shared.read(["vehicle", "sale"]) == (0, 0)
+            assert time.perf_counter() - start < 1
+    finally:
+        shared.close()
+        engine.dispose()
+
+
+def test_stats_survives_unreadable_shared_generations(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    cache = ResponseCache(shared=SharedGenerations(engine))
+    cache.invalidate("vehicle")
+
+    stats = cache.stats()
+
+    assert stats["shared_generations"] is True
+    assert stats["generations"] == {"vehicle": 1}
+    engine.dispose()
@@ -19,6 +19,7 @@ export type Vehicle = {
   purchase_date?: string | null;
   sale_date?: string | null;
   notes?: string | null;
+  created_at?: string;
 };
 
 export type Expense = {
@@ -40,6 +41,13 @@ export type Sale = {
   client_tax_id?: string | null;
 };
 
+export type VehicleChanges = {
+  changes: Vehicle[];
+  deleted: number[];
+  token: string;
+  hasMore: boolean;
+};
+
 export type DashboardSummary = {
   vehicles: number;
   income: number;
@@ -75,6 +83,13 @@ async function fetchJson<T>(path: string, options: RequestInit = {}): Promise<T>
   }
 }
 
+// El backend usa branch_id/status; la web, location_id/state
+const fromBackendVehicle = (v: any): Vehicle => ({
+  ...v,
+  location_id: v.branch_id,
+  state: v.status,
+});
+
 export const api = {
   getBranches: () => fetchJson<Branch[]>("/branches"),
   getDashboard: (params: { from?: string; to?: string; branchId?: number }) => {
@@ -85,20 +100,38 @@ export const api = {
     const qs = search.toString();
     return fetchJson<DashboardSummary>(`/dashboard${qs ? `?${qs}` : ""}`);
   },
-  listVehicles: (params: { state?: string; branchId?: number; from?: string; to?: string }) => {
+  listVehicles: (params: { state?: string; branchId?: number; from?: string; to?: string; limit?: number; cursor?: string }) => {
     const search = new URLSearchParams();
     if (params.state) search.append("state", params.state);
     if (params.branchId) search.append("branch_id", String(params.branchId));
     if (params.from) search.append("from_date", params.from);
     if (params.to) search.append("to_date", params.to);
+    if (params.limit) search.append("limit", String(params.limit));
+    if (params.cursor) search.append("cursor", params.cursor);
     const qs = search.toString();
-    return fetchJson<any[]>(`/vehicles${qs ? `?${qs}` : ""}`).then((res) =>
-      res.map((v) => ({
-        ...v,
-        location_id: v.branch_id,
-        state: v.status,
-      }))
-    );
+    return fetch(`${API_URL}/vehicles${qs ? `?${qs}` : ""}`).then(async (response) => {
+      const detail = await response.text();
+      if (!response.ok) {
+        throw new Error(detail || `Error ${response.status}: ${response.statusText}`);
+      }
+      const items = (JSON.parse(detail) as any[]).map(fromBackendVehicle);
+      return { items, nextCursor: response.headers.get("X-Next-Cursor") };
+    });
+  },
+  // Sin `since` solo devuelve el token actual, para pedir despues los cambios desde ahi
+  vehicleChanges: (since?: string) =>
+    fetchJson<any>(`/vehicles/changes${since ? `?since=${encodeURIComponent(since)}` : ""}`).then(
+      (res): VehicleChanges => ({
+        changes: res.changes.map(fromBackendVehicle),
+        deleted: res.deleted,
+        token: res.token,
+        hasMore: res.has_more,
+      })
+    ),
+  subscribeVehicleChanges: (onChange: () => void) => {
+    const source = new EventSource(`${API_URL}/vehicles/changes/stream`);
+    source.addEventListener("changes", onChange);
+    return () => source.close();
   },
   createVehicle: (payload: Vehicle) => {
     // Mapear nombres de campos frontend a backend
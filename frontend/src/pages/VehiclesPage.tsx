@@ -1,4 +1,4 @@
-import { useEffect, useMemo, useState } from "react";
+import { useEffect, useMemo, useRef, useState } from "react";
 import { api, Branch, formatCurrency, formatDate, vehicleStates, Vehicle } from "../lib/api";
 import {
   Button,
@@ -17,25 +17,109 @@ import { DateInput } from "@mantine/dates";
 import { notifications } from "@mantine/notifications";
 
 const INITIAL_FORM: Vehicle = { state: "pendiente recepcion" };
+const PAGE_SIZE = 100;
+
+type VehicleFilters = { state?: string; branchId?: number; from?: string; to?: string };
+
+function matchesFilters(vehicle: Vehicle, filters: VehicleFilters) {
+  if (filters.state && vehicle.state !== filters.state) return false;
+  if (filters.branchId && vehicle.location_id !== filters.branchId) return false;
+  if (filters.from && (!vehicle.purchase_date || vehicle.purchase_date < filters.from)) return false;
+  if (filters.to && (!vehicle.purchase_date || vehicle.purchase_date > filters.to)) return false;
+  return true;
+}
+
+// Orden del listado en el backend: created_at descendente y, a igualdad, id descendente.
+// Las fechas ISO del backend se comparan bien como texto.
+function compareListOrder(a: Vehicle, b: Vehicle) {
+  const aCreated = a.created_at ?? "";
+  const bCreated = b.created_at ?? "";
+  if (aCreated !== bCreated) return aCreated < bCreated ? 1 : -1;
+  return (b.id ?? 0) - (a.id ?? 0);
+}
 
 export default function VehiclesPage() {
   const [vehicles, setVehicles] = useState<Vehicle[]>([]);
   const [branches, setBranches] = useState<Branch[]>([]);
   const [loading, setLoading] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [creating, setCreating] = useState(false);
-  const [filters, setFilters] = useState<{ state?: string; branchId?: number; from?: string; to?: string }>({});
+  const [filters, setFilters] = useState<VehicleFilters>({});
   const [form, setForm] = useState<Vehicle>(INITIAL_FORM);
+  // Token del feed de cambios: tras la carga inicial solo se piden las filas modificadas
+  const changesToken = useRef<string | null>(null);
+  const syncRef = useRef<() => void>(() => {});
+  // Ultima fila devuelta por el servidor si quedan paginas: lo que ordena despues llegara al paginar
+  const loadedUntil = useRef<Vehicle | null>(null);
+
+  const fetchVehicles = async () => {
+    setLoading(true);
+    try {
+      // El token se toma antes del listado: lo que cambie entremedias llega en la siguiente sincronizacion
+      const { token } = await api.vehicleChanges();
+      const page = await api.listVehicles({ ...filters, limit: PAGE_SIZE });
+      changesToken.current = token;
+      loadedUntil.current = page.nextCursor ? page.items[page.items.length - 1] : null;
+      setVehicles(page.items);
+      setNextCursor(page.nextCursor);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const syncVehicles = async () => {
+    if (!changesToken.current) {
+      return fetchVehicles();
+    }
+    let token = changesToken.current;
+    let hasMore = true;
+    while (hasMore) {
+      const delta = await api.vehicleChanges(token);
+      const deleted = new Set(delta.deleted);
+      setVehicles((prev) => {
+        const changed = new Map(delta.changes.map((v) => [v.id, v]));
+        const kept = prev
+          .filter((v) => !deleted.has(v.id!))
+          .map((v) => changed.get(v.id) ?? v)
+          .filter((v) => matchesFilters(v, filters));
+        const known = new Set(prev.map((v) => v.id));
+        const end = loadedUntil.current;
+        // Solo se insertan las filas que caen dentro de lo ya cargado, en su posicion
+        const added = delta.changes.filter(
+          (v) =>
+            !known.has(v.id) &&
+            !deleted.has(v.id!) &&
+            matchesFilters(v, filters) &&
+            (!end || compareListOrder(v, end) <= 0)
+        );
+        return added.length ? [...kept, ...added].sort(compareListOrder) : kept;
+      });
+      token = delta.token;
+      hasMore = delta.hasMore;
+    }
+    changesToken.current = token;
+  };
+  syncRef.current = () => {
+    syncVehicles().catch((error) => console.error("Error al sincronizar vehículos:", error));
+  };
 
-  const fetchVehicles = () => {
+  const fetchMoreVehicles = () => {
+    if (!nextCursor) return;
     setLoading(true);
     api
-      .listVehicles(filters)
-      .then(setVehicles)
+      .listVehicles({ ...filters, limit: PAGE_SIZE, cursor: nextCursor })
+      .then((page) => {
+        loadedUntil.current = page.nextCursor ? page.items[page.items.length - 1] : null;
+        setVehicles((prev) => [...prev, ...page.items]);
+        setNextCursor(page.nextCursor);
+      })
       .finally(() => setLoading(false));
   };
 
   useEffect(() => {
     api.getBranches().then(setBranches);
+    // El servidor avisa por SSE de cada cambio: no hace falta refrescar a mano
+    return api.subscribeVehicleChanges(() => syncRef.current());
   }, []);
 
   useEffect(() => {
@@ -99,7 +183,7 @@ export default function VehiclesPage() {
           <Text c="dimmed">Listado con filtros y alta rápida</Text>
         </div>
         <Group>
-          <Button variant="light" loading={loading} onClick={fetchVehicles}>
+          <Button variant="light" loading={loading} onClick={() => syncRef.current()}>
             Refrescar
           </Button>
           <Button variant="outline" component="a" href="#" onClick={async (e) => {
@@ -216,6 +300,13 @@ export default function VehiclesPage() {
             )}
           </Table.Tbody>
         </Table>
+        {nextCursor && (
+          <Group justify="center" mt="md">
+            <Button variant="light" loading={loading} onClick={fetchMoreVehicles}>
+              Cargar más
+            </Button>
+          </Group>
+        )}
       </Card>
     </Stack>
   );
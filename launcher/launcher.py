@@ -10,7 +10,11 @@ import subprocess
 import tkinter as tk
 from tkinter import messagebox
 from pathlib import Path
+import queue
 import signal
+import threading
+import time
+import urllib.request
 import webbrowser
 
 # ==============================
@@ -24,6 +28,12 @@ FRONTEND_DIR = REPO_ROOT / "frontend"
 BACKEND_PORT = 8000
 FRONTEND_PORT = 5173
 
+# Produccion: uvicorn con varios workers y sin --reload; el backend sirve el build
+# de frontend/dist en su mismo puerto. Desarrollo: --reload y servidor de Vite.
+DEV_MODE_DEFAULT = os.getenv("SAHOCARS_MODE", "produccion") == "desarrollo"
+BACKEND_WORKERS = int(os.getenv("SAHOCARS_WORKERS", "2"))
+FRONTEND_DIST = FRONTEND_DIR / "dist"
+
 # Ajusta si tu FastAPI usa otra ruta
 # Ejemplos:
 # "main:app"
@@ -31,9 +41,18 @@ FRONTEND_PORT = 5173
 UVICORN_APP = "main:app"
 
 WINDOWS = os.name == "nt"
+NPM = "npm.cmd" if WINDOWS else "npm"
+
+# Supervisor: cada cuanto se comprueba el estado, cuanto se espera a /health en un
+# arranque, cuanto se deja a los procesos para cerrar limpio y el tope del backoff
+SUPERVISOR_INTERVAL = 1.0
+READY_TIMEOUT = 90
+DRAIN_TIMEOUT = 10
+RESTART_BACKOFF_MAX = 60
+# Un proceso que lleva este tiempo listo vuelve a empezar el backoff desde 1 s
+STABLE_AFTER = 120
 
-backend_proc = None
-frontend_proc = None
+ui_queue = queue.Queue()
 
 
 # ---------- Helpers ----------
@@ -50,7 +69,8 @@ def ensure_paths():
 
 
 def popen(cmd, cwd: Path):
-    creationflags = subprocess.CREATE_NEW_CONSOLE if WINDOWS else 0
+    # Cada servicio en su propio grupo de procesos para poder mandarle Ctrl+Break al parar
+    creationflags = subprocess.CREATE_NEW_CONSOLE | subprocess.CREATE_NEW_PROCESS_GROUP if WINDOWS else 0
     return subprocess.Popen(cmd, cwd=str(cwd), creationflags=creationflags)
 
 
@@ -60,11 +80,14 @@ def run_sync(cmd, cwd: Path):
     return p.wait()
 
 
-def terminate_tree(proc):
-    if not proc:
-        return
-    if proc.poll() is not None:
-        return
+def build_frontend():
+    """npm run build + variantes .gz/.br que sirve el backend. Devuelve True si fue bien."""
+    if run_sync([NPM, "run", "build"], FRONTEND_DIR) != 0:
+        return False
+    return run_sync([sys.executable, "frontend_static.py"], BACKEND_DIR) == 0
+
+
+def kill_tree(proc):
     try:
         if WINDOWS:
             subprocess.run(
@@ -72,92 +95,304 @@ def terminate_tree(proc):
                 check=False
             )
         else:
-            proc.send_signal(signal.SIGTERM)
+            proc.kill()
     except Exception:
         pass
 
 
-# ---------- Actions ----------
+# GenerateConsoleCtrlEvent solo llega a procesos de la consola del que lo llama y el
+# launcher no tiene consola (console=False en el .spec): un python auxiliar se engancha
+# a la consola del servicio y manda Ctrl+Break a su grupo. uvicorn lo recibe como
+# SIGBREAK y termina las peticiones en curso, tambien en cada worker.
+CTRL_BREAK_SCRIPT = (
+    "import ctypes, sys\n"
+    "kernel32 = ctypes.windll.kernel32\n"
+    "pid = int(sys.argv[1])\n"
+    "kernel32.FreeConsole()\n"
+    "sent = kernel32.AttachConsole(pid) and kernel32.SetConsoleCtrlHandler(None, True) "
+    "and kernel32.GenerateConsoleCtrlEvent(1, pid)\n"
+    "sys.exit(0 if sent else 1)\n"
+)
+
+
+def send_ctrl_break(proc):
+    """Manda Ctrl+Break al grupo de procesos de `proc`. Devuelve True si se envio."""
+    result = subprocess.run(
+        [sys.executable, "-c", CTRL_BREAK_SCRIPT, str(proc.pid)],
+        creationflags=subprocess.CREATE_NO_WINDOW,
+        timeout=DRAIN_TIMEOUT,
+        check=False
+    )
+    return result.returncode == 0
+
+
+def terminate_tree(proc, timeout=DRAIN_TIMEOUT):
+    """Pide un cierre limpio y espera `timeout` segundos antes de matar el arbol."""
+    if not proc:
+        return
+    if proc.poll() is not None:
+        return
+    try:
+        if WINDOWS:
+            if not send_ctrl_break(proc):
+                print(f"No se pudo mandar Ctrl+Break a {proc.pid}: se fuerza el cierre")
+                kill_tree(proc)
+                return
+        else:
+            proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_tree(proc)
+    except Exception:
+        kill_tree(proc)
 
-def start_services():
-    global backend_proc, frontend_proc
+
+def is_healthy(url):
     try:
-        ensure_paths()
-    except Exception as e:
-        messagebox.showerror("Error", str(e))
-        return
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status == 200
+    except Exception:
+        return False
+
+
+# ---------- UI desde otros hilos ----------
+
+def ui(fn, *args):
+    """Tk no es seguro entre hilos: el supervisor encola y el hilo de la UI ejecuta."""
+    ui_queue.put((fn, args))
+
+
+def set_status(text):
+    ui(status_var.set, text)
+
+
+def pump_ui():
+    while True:
+        try:
+            fn, args = ui_queue.get_nowait()
+        except queue.Empty:
+            break
+        fn(*args)
+    root.after(100, pump_ui)
+
+
+# ---------- Supervisor ----------
+
+class Child:
+    def __init__(self, name, cmd, cwd, health_url):
+        self.name = name
+        self.cmd = cmd
+        self.cwd = cwd
+        self.health_url = health_url
+        self.proc = None
+        self.started_at = 0.0
+        self.ready_at = None
+        self.backoff = 1.0
+        self.restart_at = None
+        self.restarts = 0
+
+    def spawn(self):
+        self.proc = popen(self.cmd, self.cwd)
+        self.started_at = time.monotonic()
+        self.ready_at = None
+        self.restart_at = None
+
+    def describe(self):
+        if self.restart_at is not None:
+            return f"{self.name}: reinicio en {max(self.restart_at - time.monotonic(), 0):.0f} s"
+        if self.ready_at is None:
+            return f"{self.name}: arrancando..."
+        suffix = f", {self.restarts} reinicios" if self.restarts else ""
+        return f"{self.name}: listo en {self.ready_at - self.started_at:.1f} s{suffix}"
+
+
+class Supervisor(threading.Thread):
+    """Hilo que arranca, vigila y para los servicios; la UI solo le manda ordenes."""
+
+    def __init__(self):
+        super().__init__(daemon=True, name="supervisor")
+        self.commands = queue.Queue()
+        self.children = []
+        self.last_status = None
+
+    def submit(self, command, **options):
+        self.commands.put((command, options))
+
+    def run(self):
+        while True:
+            try:
+                command, options = self.commands.get(timeout=SUPERVISOR_INTERVAL)
+            except queue.Empty:
+                command = None
+            try:
+                if command == "start":
+                    self.start_services(**options)
+                elif command == "stop":
+                    self.stop_services()
+                elif command == "update":
+                    self.update_project(**options)
+                elif command == "exit":
+                    self.stop_services()
+                    ui(root.destroy)
+                    return
+                self.check_children()
+            except Exception as e:
+                print(f"Error en supervisor: {str(e)}")
+                set_status(f"Error: {e}")
+
+    def start_services(self, dev_mode):
+        try:
+            ensure_paths()
+        except Exception as e:
+            ui(messagebox.showerror, "Error", str(e))
+            return
+        if any(child.proc and child.proc.poll() is None for child in self.children):
+            return
+
+        if not dev_mode and not (FRONTEND_DIST / "index.html").exists():
+            set_status("Compilando frontend...")
+            if not build_frontend():
+                ui(messagebox.showerror, "Error", "No se pudo compilar el frontend.\nRevisa la consola.")
+                set_status("Parado")
+                return
 
-    # Backend
-    if backend_proc is None or backend_proc.poll() is not None:
         backend_cmd = [
             sys.executable,
             "-m", "uvicorn",
             UVICORN_APP,
-            "--reload",
             "--host", "127.0.0.1",
             "--port", str(BACKEND_PORT),
         ]
-        backend_proc = popen(backend_cmd, BACKEND_DIR)
+        if dev_mode:
+            backend_cmd.append("--reload")
+        else:
+            backend_cmd += ["--workers", str(BACKEND_WORKERS)]
+        self.children = [Child("Backend", backend_cmd, BACKEND_DIR, f"http://127.0.0.1:{BACKEND_PORT}/health")]
+
+        # Frontend (en produccion lo sirve el backend)
+        if dev_mode:
+            frontend_cmd = [
+                NPM, "run", "dev", "--",
+                "--host", "127.0.0.1",
+                "--port", str(FRONTEND_PORT),
+            ]
+            self.children.append(Child("Frontend", frontend_cmd, FRONTEND_DIR, f"http://127.0.0.1:{FRONTEND_PORT}/"))
+
+        for child in self.children:
+            child.spawn()
+
+    def stop_services(self):
+        if self.children:
+            set_status("Parando servicios...")
+        # Primero el frontend: el backend puede seguir drenando peticiones mientras
+        for child in reversed(self.children):
+            terminate_tree(child.proc)
+        self.children = []
+        self.last_status = None
+        set_status("Servicios parados")
+
+    def check_children(self):
+        if not self.children:
+            return
+        now = time.monotonic()
+        for child in self.children:
+            if child.restart_at is not None:
+                if now >= child.restart_at:
+                    child.restarts += 1
+                    child.spawn()
+                continue
+
+            if child.proc.poll() is not None:
+                # Caido: se reintenta con backoff exponencial
+                print(f"{child.name} terminó con código {child.proc.returncode}")
+                child.restart_at = now + child.backoff
+                child.backoff = min(child.backoff * 2, RESTART_BACKOFF_MAX)
+                continue
+
+            if child.ready_at is None:
+                if is_healthy(child.health_url):
+                    child.ready_at = now
+                elif now - child.started_at > READY_TIMEOUT:
+                    print(f"{child.name} no responde tras {READY_TIMEOUT} s: se reinicia")
+                    terminate_tree(child.proc)
+            elif now - child.ready_at > STABLE_AFTER:
+                child.backoff = 1.0
+
+        status = "   |   ".join(child.describe() for child in self.children)
+        if status != self.last_status:
+            self.last_status = status
+            set_status(status)
+
+    def update_project(self, dev_mode):
+        try:
+            ensure_paths()
+        except Exception as e:
+            ui(messagebox.showerror, "Error", str(e))
+            return
+
+        self.stop_services()
+        set_status("Actualizando...")
+
+        # Git pull (seguro, sin reset hard)
+        rc = run_sync(["git", "pull"], REPO_ROOT)
+        if rc != 0:
+            ui(
+                messagebox.showwarning,
+                "Actualizar",
+                "git pull terminó con errores.\nRevisa la consola."
+            )
+            set_status("Parado")
+            return
+
+        # Backend deps
+        req = BACKEND_DIR / "requirements.txt"
+        if req.exists():
+            run_sync(
+                [sys.executable, "-m", "pip", "install", "-r", str(req)],
+                BACKEND_DIR
+            )
 
-    # Frontend
-    if frontend_proc is None or frontend_proc.poll() is not None:
-        frontend_cmd = [
-            "npm.cmd", "run", "dev", "--",
-            "--host", "127.0.0.1",
-            "--port", str(FRONTEND_PORT),
-        ]
-        frontend_proc = popen(frontend_cmd, FRONTEND_DIR)
+        # Frontend deps
+        lock = FRONTEND_DIR / "package-lock.json"
+        if lock.exists():
+            run_sync([NPM, "ci"], FRONTEND_DIR)
+        else:
+            run_sync([NPM, "install"], FRONTEND_DIR)
+
+        # El build antiguo no vale tras un pull
+        if not dev_mode and not build_frontend():
+            ui(
+                messagebox.showwarning,
+                "Actualizar",
+                "No se pudo compilar el frontend.\nRevisa la consola."
+            )
+            set_status("Parado")
+            return
 
-    status_var.set("Backend y Frontend en marcha")
+        set_status("Proyecto actualizado")
 
 
-def stop_services():
-    global backend_proc, frontend_proc
-    terminate_tree(frontend_proc)
-    terminate_tree(backend_proc)
-    frontend_proc = None
-    backend_proc = None
-    status_var.set("Servicios parados")
+supervisor = Supervisor()
 
 
-def update_project():
-    try:
-        ensure_paths()
-    except Exception as e:
-        messagebox.showerror("Error", str(e))
-        return
+# ---------- Actions ----------
 
-    stop_services()
+def start_services():
+    status_var.set("Arrancando...")
+    supervisor.submit("start", dev_mode=dev_mode_var.get())
 
-    # Git pull (seguro, sin reset hard)
-    rc = run_sync(["git", "pull"], REPO_ROOT)
-    if rc != 0:
-        messagebox.showwarning(
-            "Actualizar",
-            "git pull terminó con errores.\nRevisa la consola."
-        )
-        return
 
-    # Backend deps
-    req = BACKEND_DIR / "requirements.txt"
-    if req.exists():
-        run_sync(
-            [sys.executable, "-m", "pip", "install", "-r", str(req)],
-            BACKEND_DIR
-        )
+def stop_services():
+    supervisor.submit("stop")
 
-    # Frontend deps
-    lock = FRONTEND_DIR / "package-lock.json"
-    if lock.exists():
-        run_sync(["npm", "ci"], FRONTEND_DIR)
-    else:
-        run_sync(["npm", "install"], FRONTEND_DIR)
 
-    status_var.set("Proyecto actualizado")
+def update_project():
+    supervisor.submit("update", dev_mode=dev_mode_var.get())
 
 
 def open_frontend():
-    webbrowser.open(f"http://localhost:{FRONTEND_PORT}")
+    port = FRONTEND_PORT if dev_mode_var.get() else BACKEND_PORT
+    webbrowser.open(f"http://localhost:{port}")
 
 
 def open_backend_docs():
@@ -165,15 +400,16 @@ def open_backend_docs():
 
 
 def exit_app():
-    stop_services()
-    root.destroy()
+    status_var.set("Parando servicios...")
+    # El supervisor para los procesos y cierra la ventana al terminar
+    supervisor.submit("exit")
 
 
 # ---------- UI ----------
 
 root = tk.Tk()
 root.title("Sahocars Launcher")
-root.geometry("520x260")
+root.geometry("520x290")
 root.resizable(False, False)
 
 tk.Label(
@@ -184,10 +420,18 @@ tk.Label(
 
 tk.Label(
     root,
-    text=f"Backend: http://localhost:{BACKEND_PORT}   |   Frontend: http://localhost:{FRONTEND_PORT}",
+    text=f"Backend: http://localhost:{BACKEND_PORT}   |   Frontend (desarrollo): http://localhost:{FRONTEND_PORT}",
     font=("Segoe UI", 9)
 ).pack(pady=2)
 
+dev_mode_var = tk.BooleanVar(value=DEV_MODE_DEFAULT)
+tk.Checkbutton(
+    root,
+    text="Modo desarrollo (--reload y servidor de Vite)",
+    variable=dev_mode_var,
+    font=("Segoe UI", 9)
+).pack()
+
 buttons = tk.Frame(root)
 buttons.pack(pady=15)
 
@@ -209,9 +453,11 @@ tk.Button(links, text="Salir", width=16, command=exit_app)\
     .grid(row=0, column=2, padx=8)
 
 status_var = tk.StringVar(value="Parado")
-tk.Label(root, textvariable=status_var, font=("Segoe UI", 10)).pack(pady=12)
+tk.Label(root, textvariable=status_var, font=("Segoe UI", 10), wraplength=500).pack(pady=12)
 
 root.protocol("WM_DELETE_WINDOW", exit_app)
+supervisor.start()
+pump_ui()
 root.mainloop()
 
 